@@ -0,0 +1,110 @@
+"""Benchmark: peak memory of a base64 image upload, buffered versus streamed.
+
+Each run happens in a fresh process that reads a JSON upload body
+({"image_base64": "data:image/jpeg;base64,..."}) from a file, the way a
+worker reads it from the request, and stores the image:
+
+  buffered  what upload_tracking_image() used to do: parse the whole body,
+            split off the data: prefix, b64decode it all and write it out
+  streamed  the current path: iter_string_field() + Base64Reader feeding
+            ImageStore.save(), which decodes and writes in chunks
+
+Reported is the growth of peak RSS over the process's baseline after imports.
+
+Usage: python bench_upload_memory.py [--size-mb 10]
+"""
+import argparse
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def reset_peak():
+    """Restart peak tracking at the current RSS (Linux); returns the baseline in KB"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return rss_kb('VmRSS')
+    except OSError:
+        # Elsewhere the peak since process start has to do
+        return peak_rss_kb()
+
+
+def rss_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def peak_rss_kb():
+    if os.path.exists('/proc/self/status'):
+        return rss_kb('VmHWM')
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_buffered(body_path, upload_dir):
+    with open(body_path, 'rb') as f:
+        payload = json.loads(f.read())
+    image_data = payload['image_base64']
+    if ',' in image_data:
+        image_data = image_data.split(',')[1]
+    image_bytes = base64.b64decode(image_data)
+    with open(os.path.join(upload_dir, 'buffered.jpg'), 'wb') as f:
+        f.write(image_bytes)
+
+
+def run_streamed(body_path, upload_dir):
+    from images import Base64Reader, ImageStore
+    from json_stream import iter_string_field
+    # No variant workers: resizing is not part of the upload being measured
+    image_store = ImageStore(upload_dir, workers=0)
+    with open(body_path, 'rb') as f:
+        image_store.save(Base64Reader(iter_string_field(f, 'image_base64')))
+
+
+def child(mode, body_path, upload_dir):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import images, json_stream  # noqa: F401  imported before the baseline is taken
+    baseline = reset_peak()
+    start = time.perf_counter()
+    (run_buffered if mode == 'buffered' else run_streamed)(body_path, upload_dir)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'peak_kb': peak_rss_kb() - baseline, 'seconds': elapsed}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size-mb', type=float, default=10)
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as work:
+        # A JPEG signature followed by random bytes: incompressible, like a photo
+        image = b'\xff\xd8\xff\xe0' + os.urandom(int(args.size_mb * 1024 * 1024))
+        body_path = os.path.join(work, 'body.json')
+        with open(body_path, 'w') as f:
+            json.dump({'image_base64': 'data:image/jpeg;base64,' + base64.b64encode(image).decode()}, f)
+        print(f"Image {len(image) / 1048576:.1f} MB, request body {os.path.getsize(body_path) / 1048576:.1f} MB")
+
+        for mode in ['buffered', 'streamed']:
+            upload_dir = os.path.join(work, mode)
+            os.makedirs(upload_dir)
+            output = subprocess.run([sys.executable, __file__, '--child', mode, body_path, upload_dir],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:>9}: peak RSS +{result['peak_kb'] / 1024:6.1f} MB in {result['seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
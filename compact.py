@@ -0,0 +1,180 @@
+import copy
+import sys
+from array import array
+from collections.abc import Mapping
+
+# Shipment fields kept in slots, in the order add_tracking creates them; 'locations' follows status
+FIELDS = ('name', 'address', 'city', 'state', 'zip', 'delivery_date', 'status',
+          'created_at', 'last_updated', 'image_url', 'location_seq')
+# Fields whose values repeat across shipments and are stored once
+INTERNED = frozenset(['city', 'state', 'zip', 'delivery_date', 'status'])
+_BEFORE_LOCATIONS = FIELDS[:FIELDS.index('status') + 1]
+_AFTER_LOCATIONS = FIELDS[len(_BEFORE_LOCATIONS):]
+# Location points that look exactly like this are packed into arrays
+_POINT_KEYS = frozenset(['city', 'lat', 'long', 'seq', 'timestamp'])
+_NO_SEQ = -1.0
+_MISSING = object()
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _packable(point):
+    """A point packs only if unpacking it gives back the same JSON"""
+    return (type(point) is dict and point.keys() <= _POINT_KEYS
+            and type(point.get('city')) is str
+            and type(point.get('lat')) is float and type(point.get('long')) is float
+            and type(point.get('seq', 0)) is int and point.get('seq', 0) >= 0
+            and type(point.get('timestamp', '')) is str)
+
+
+class CompactShipment(Mapping):
+    """Read-only shipment record laid out for a small memory footprint.
+
+    Known fields live in slots (an unset slot is an absent key) with
+    repeating strings interned, and location points are packed into one
+    float64 array of (lat, long, seq) triples plus tuples of city names and,
+    when points carry them, timestamps.
+    Anything else, such as unusual location points or extra fields, is kept
+    as given. Reading it as a mapping gives back the same JSON as the dict
+    it was built from; use to_dict() for a private mutable copy.
+    """
+
+    __slots__ = FIELDS + ('_points', '_cities', '_times', '_raw_locations', '_extra')
+
+    def __init__(self, record):
+        extra = None
+        for key, value in record.items():
+            if key == 'locations':
+                self._set_locations(value)
+            elif key in INTERNED:
+                setattr(self, key, _intern(value))
+            elif key in FIELDS:
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
+
+    def _set_locations(self, locations):
+        if type(locations) is list and all(_packable(point) for point in locations):
+            points = array('d')
+            for point in locations:
+                points.extend((point['lat'], point['long'], point.get('seq', _NO_SEQ)))
+            self._points = points
+            self._cities = tuple(sys.intern(point['city']) for point in locations)
+            if any('timestamp' in point for point in locations):
+                self._times = tuple(point.get('timestamp') for point in locations)
+        else:
+            self._raw_locations = locations
+
+    def _locations(self):
+        try:
+            points = self._points
+        except AttributeError:
+            return self._raw_locations
+        times = getattr(self, '_times', None)
+        locations = []
+        for i, city in enumerate(self._cities):
+            point = {'city': city, 'lat': points[3 * i], 'long': points[3 * i + 1]}
+            seq = points[3 * i + 2]
+            if seq != _NO_SEQ:
+                point['seq'] = int(seq)
+            if times is not None and times[i] is not None:
+                point['timestamp'] = times[i]
+            locations.append(point)
+        return locations
+
+    def latest_location(self):
+        """The newest location point, without unpacking the others; None if there is none"""
+        points = getattr(self, '_points', None)
+        if points is None:
+            locations = getattr(self, '_raw_locations', None)
+            return locations[0] if locations else None
+        if not points:
+            return None
+        point = {'city': self._cities[0], 'lat': points[0], 'long': points[1]}
+        if points[2] != _NO_SEQ:
+            point['seq'] = int(points[2])
+        return point
+
+    def _has_locations(self):
+        return hasattr(self, '_points') or hasattr(self, '_raw_locations')
+
+    def __getitem__(self, key):
+        if key == 'locations':
+            if not self._has_locations():
+                raise KeyError(key)
+            return self._locations()
+        if key in FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in FIELDS:
+            return getattr(self, key, default)
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if key in FIELDS:
+            return hasattr(self, key)
+        return key == 'locations' and self._has_locations() or self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for name in _BEFORE_LOCATIONS:
+            if hasattr(self, name):
+                yield name
+        if self._has_locations():
+            yield 'locations'
+        for name in _AFTER_LOCATIONS:
+            if hasattr(self, name):
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"CompactShipment({self.to_dict()!r})"
+
+    def to_dict(self):
+        """Return a private, mutable dict copy of the record"""
+        record = {}
+        for name in _BEFORE_LOCATIONS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                record[name] = value
+        if hasattr(self, '_points'):
+            record['locations'] = self._locations()
+        elif hasattr(self, '_raw_locations'):
+            record['locations'] = copy.deepcopy(self._raw_locations)
+        for name in _AFTER_LOCATIONS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                record[name] = value
+        if self._extra is not None:
+            for key, value in self._extra.items():
+                record[key] = copy.deepcopy(value)
+        return record
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def compact(record):
+    """Return record as a CompactShipment"""
+    return record if isinstance(record, CompactShipment) else CompactShipment(record)
@@ -0,0 +1,159 @@
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Metres per degree of latitude; a degree of longitude is this times cos(latitude)
+METERS_PER_DEGREE = 111320.0
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker: indexes of the (lat, long) points to keep so the path stays within tolerance metres"""
+    if len(points) <= 2:
+        return list(range(len(points)))
+    scale = math.cos(math.radians(sum(lat for lat, _ in points) / len(points))) * METERS_PER_DEGREE
+    xy = [(long * scale, lat * METERS_PER_DEGREE) for lat, long in points]
+    keep = {0, len(points) - 1}
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        worst, worst_distance = None, tolerance
+        for i in range(first + 1, last):
+            x, y = xy[i]
+            if length:
+                distance = abs(dy * (x - x1) - dx * (y - y1)) / length
+            else:
+                distance = math.hypot(x - x1, y - y1)
+            if distance > worst_distance:
+                worst, worst_distance = i, distance
+        if worst is not None:
+            keep.add(worst)
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return sorted(keep)
+
+
+class LocationHistory:
+    """Append-only location time series per shipment, kept in its own SQLite database.
+
+    The newest full_resolution points of a shipment are kept as recorded.
+    Older points are thinned with Douglas-Peucker at tolerance metres once
+    enough of them pile up, and the tolerance is raised until at most
+    max_points older points remain, so storage per shipment stays bounded.
+    """
+
+    def __init__(self, path, full_resolution=200, tolerance=25.0, max_points=1000):
+        self.path = path
+        self.full_resolution = full_resolution
+        self.tolerance = tolerance
+        self.max_points = max_points
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connect(self):
+        # SQLite connections must not be shared across fork()ed gunicorn workers
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            conn.execute('CREATE TABLE IF NOT EXISTS points ('
+                         'tracking_id TEXT NOT NULL, seq INTEGER NOT NULL, recorded_at TEXT NOT NULL, '
+                         'lat REAL NOT NULL, long REAL NOT NULL, city TEXT, '
+                         'archived INTEGER NOT NULL DEFAULT 0, '
+                         'PRIMARY KEY (tracking_id, seq)) WITHOUT ROWID')
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def append_many(self, entries):
+        """Record the points of several shipments, given as (tracking_id, points) pairs, in one transaction.
+
+        Each point needs seq, lat and long and may carry city and timestamp.
+        """
+        now = str(datetime.now())
+        rows = []
+        for tracking_id, points in entries:
+            for point in points:
+                try:
+                    rows.append((tracking_id, int(point['seq']), str(point.get('timestamp') or now),
+                                 float(point['lat']), float(point['long']), point.get('city')))
+                except (KeyError, TypeError, ValueError):
+                    continue  # points without usable coordinates have no place on a map
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('INSERT OR REPLACE INTO points (tracking_id, seq, recorded_at, lat, long, city) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', rows)
+                for tracking_id in {row[0] for row in rows}:
+                    self._apply_retention(conn, tracking_id)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _apply_retention(self, conn, tracking_id):
+        row = conn.execute('SELECT seq FROM points WHERE tracking_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?',
+                           (tracking_id, self.full_resolution)).fetchone()
+        if row is None:
+            return
+        cutoff = row[0]
+        # Thin in batches rather than on every append
+        pending = conn.execute('SELECT COUNT(*) FROM points WHERE tracking_id = ? AND seq <= ? AND archived = 0',
+                               (tracking_id, cutoff)).fetchone()[0]
+        if pending < max(1, self.full_resolution // 4):
+            return
+        older = conn.execute('SELECT seq, lat, long FROM points WHERE tracking_id = ? AND seq <= ? ORDER BY seq',
+                             (tracking_id, cutoff)).fetchall()
+        coordinates = [(lat, long) for _, lat, long in older]
+        tolerance = self.tolerance
+        keep = simplify(coordinates, tolerance)
+        while len(keep) > self.max_points and tolerance < 1e7:
+            tolerance *= 2
+            keep = simplify(coordinates, tolerance)
+        if len(keep) > self.max_points:
+            keep = keep[::math.ceil(len(keep) / self.max_points)]
+        kept = {older[i][0] for i in keep}
+        conn.executemany('DELETE FROM points WHERE tracking_id = ? AND seq = ?',
+                         [(tracking_id, seq) for seq, _, _ in older if seq not in kept])
+        conn.execute('UPDATE points SET archived = 1 WHERE tracking_id = ? AND seq <= ?', (tracking_id, cutoff))
+
+    def trail(self, tracking_id, since=None, limit=None):
+        """Return a shipment's recorded points, oldest first, optionally only those after seq `since`"""
+        query = 'SELECT seq, recorded_at, lat, long, city, archived FROM points WHERE tracking_id = ? AND seq > ?'
+        params = [tracking_id, since if since is not None else -1]
+        if limit:
+            # The newest `limit` points, still returned oldest first
+            query = f'SELECT * FROM ({query} ORDER BY seq DESC LIMIT ?) ORDER BY seq'
+            params.append(limit)
+        else:
+            query += ' ORDER BY seq'
+        with self._lock:
+            rows = self._connect().execute(query, params).fetchall()
+        return [{'seq': seq, 'timestamp': recorded_at, 'lat': lat, 'long': long, 'city': city,
+                 'simplified': bool(archived)}
+                for seq, recorded_at, lat, long, city, archived in rows]
+
+    def delete(self, tracking_ids):
+        """Forget the history of removed shipments"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('DELETE FROM points WHERE tracking_id = ?', [(tid,) for tid in tracking_ids])
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute('DELETE FROM points')
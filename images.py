@@ -0,0 +1,387 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Without Pillow uploads are still validated and stored; variants fall back to the original
+    Image = None
+    print("⚠️ Pillow is not installed: thumbnail and preview variants will serve full-size originals")
+
+# Leading bytes of every accepted format, mapped to the extension it is stored under
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+IMAGE_EXTENSIONS = ('png', 'jpg', 'gif', 'webp')
+# Resized variants: name -> longest edge in pixels
+VARIANTS = {'thumbnail': 200, 'preview': 800}
+# Names of content-addressed files: <sha256>.<ext> originals and <sha256>_<variant>.<ext> variants
+_BLOB_RE = re.compile(r'^([0-9a-f]{64})(?:_([a-z]+))?\.([a-z]+)$')
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class Base64Reader:
+    """Binary stream over base64 text that arrives in pieces, optionally as a data: URL.
+
+    Decodes as it is read, so only a piece of the text and of the decoded
+    bytes is held at a time. Invalid base64 raises ValueError.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text = ''
+        self._decoded = b''
+        self._started = False
+        self._eof = False
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._decoded) < size):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                if self._text or not self._started:
+                    self._decoded += base64.b64decode(self._text, validate=True)
+                    self._text = ''
+                continue
+            self._text += ''.join(chunk.split())
+            if not self._started:
+                # Drop a data:image/...;base64, prefix once all of it has arrived
+                if self._text.startswith('data:') or 'data:'.startswith(self._text):
+                    comma = self._text.find(',')
+                    if comma < 0:
+                        continue
+                    self._text = self._text[comma + 1:]
+                self._started = True
+            usable = len(self._text) // 4 * 4
+            if usable:
+                self._decoded += base64.b64decode(self._text[:usable], validate=True)
+                self._text = self._text[usable:]
+        if size < 0:
+            size = len(self._decoded)
+        data, self._decoded = self._decoded[:size], self._decoded[size:]
+        return data
+
+
+def detect_image_format(head):
+    """Extension for the image format the leading bytes belong to, or None if it is not a supported image"""
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if len(head) >= 12 and head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class ImageStore:
+    """Uploaded images stored once per content, with resized variants made in the background.
+
+    An original is named after the SHA-256 of its bytes, so uploading the
+    same photo twice stores it once. Each variant in VARIANTS is a downscaled
+    WebP made by a pool of worker threads after the upload is committed;
+    asking for a variant that is not ready yet waits for it, and without
+    Pillow the original stands in for it.
+
+    Files are stored in two levels of subfolders named after the digest
+    (see shard_path()), so no folder grows past a few thousand entries.
+    Files of the older flat layout, directly in the folder, are still found
+    until migrate_flat_files() moves them.
+    """
+
+    # An original touched this recently may be about to be referenced again, so remove() keeps it
+    GRACE_SECONDS = 300
+    # Temporary files of uploads this old were abandoned by a crashed worker
+    STALE_TEMP_SECONDS = 86400
+
+    def __init__(self, directory, workers=2, quality=80):
+        self.directory = directory
+        self.quality = quality
+        # Without workers, variants are made when first requested
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants') if workers else None
+        self._lock = threading.Lock()
+        self._pending = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def is_blob(filename):
+        match = _BLOB_RE.match(filename)
+        return match is not None and match.group(2) is None
+
+    @staticmethod
+    def is_content_addressed(filename):
+        """True for originals and variants named after their content"""
+        return _BLOB_RE.match(filename) is not None
+
+    @staticmethod
+    def variant_name(filename, variant):
+        return f"{os.path.splitext(filename)[0]}_{variant}.webp"
+
+    def variant_names(self, filename):
+        return {variant: self.variant_name(filename, variant) for variant in VARIANTS}
+
+    @staticmethod
+    def shard_path(filename):
+        """Path of a file below the folder in the fan-out layout: <ab>/<cd>/<filename>.
+
+        Content-addressed files are placed by their digest, so an original
+        and its variants share a folder; other names by a hash of the name.
+        """
+        match = _BLOB_RE.match(filename)
+        key = match.group(1) if match is not None else hashlib.sha256(filename.encode()).hexdigest()
+        return f"{key[:2]}/{key[2:4]}/{filename}"
+
+    def locate(self, filename):
+        """Path of a stored file below the folder, in either layout; None if it does not exist"""
+        for path in (self.shard_path(filename), filename):
+            if os.path.exists(os.path.join(self.directory, path)):
+                return path
+        return None
+
+    def _target(self, filename):
+        """Absolute path a file is written to, with its shard folder created"""
+        path = os.path.join(self.directory, self.shard_path(filename))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def save(self, stream, max_size=None, chunk_size=64 * 1024):
+        """Store the image read from a binary stream; returns its file name.
+
+        The bytes are written to a temporary file as they arrive and renamed
+        into place once complete. Raises ImageTooLarge as soon as more than
+        max_size bytes arrive, and ValueError if they are not a PNG, JPEG,
+        GIF or WebP image.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.upload-', suffix='.tmp')
+        try:
+            extension = None
+            head = b''
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if extension is None:
+                        # Collect enough leading bytes to tell the format, however the stream splits them
+                        head += chunk
+                        if chunk and len(head) < 12:
+                            continue
+                        extension = detect_image_format(head)
+                        if extension is None:
+                            raise ValueError('File is not a PNG, JPEG, GIF or WebP image')
+                        chunk = head
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise ImageTooLarge(f'Image larger than {max_size} bytes')
+                    digest.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            filename = f"{digest.hexdigest()}.{extension}"
+            existing = self.locate(filename)
+            if existing is not None:
+                # Same content already stored; mark it as in use again so remove() leaves it alone
+                os.remove(tmp_path)
+                os.utime(os.path.join(self.directory, existing))
+            else:
+                os.replace(tmp_path, self._target(filename))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._schedule(filename)
+        return filename
+
+    def _schedule(self, filename):
+        if Image is None or self._pool is None:
+            return
+        with self._lock:
+            if filename not in self._pending and not all(
+                    self.locate(name) is not None for name in self.variant_names(filename).values()):
+                future = self._pool.submit(self._make_variants, filename)
+                self._pending[filename] = future
+                future.add_done_callback(lambda _: self._done(filename))
+
+    def _done(self, filename):
+        with self._lock:
+            self._pending.pop(filename, None)
+
+    def _make_variants(self, filename):
+        source = self.locate(filename)
+        if source is None:
+            return
+        try:
+            with Image.open(os.path.join(self.directory, source)) as original:
+                original = ImageOps.exif_transpose(original)
+                for variant, size in VARIANTS.items():
+                    image = original.copy()
+                    image.thumbnail((size, size))
+                    if image.mode not in ('RGB', 'RGBA'):
+                        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+                    path = self._target(self.variant_name(filename, variant))
+                    fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.variant-', suffix='.tmp')
+                    try:
+                        with os.fdopen(fd, 'wb') as f:
+                            image.save(f, 'WEBP', quality=self.quality)
+                        os.replace(tmp_path, path)
+                    except Exception:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                        raise
+        except Exception as e:
+            print(f"⚠️ Could not make variants of {filename}: {e}")
+
+    def resolve(self, path):
+        """File to serve for a path below /uploads/, as a path below the folder; None if there is none.
+
+        Both layouts name the same file: a flat path finds a file already
+        moved into its shard and a sharded one a file not moved yet. A
+        variant is served once it is made, its original until then.
+        """
+        filename = path.rsplit('/', 1)[-1]
+        if path != filename and path != self.shard_path(filename):
+            return None
+        found = self.locate(filename)
+        if found is not None:
+            return found
+        match = _BLOB_RE.match(filename)
+        if match is None or match.group(2) not in VARIANTS:
+            return None
+        original = self._original(match.group(1))
+        if original is None:
+            return None
+        if Image is not None:
+            self._schedule(original)
+            with self._lock:
+                future = self._pending.get(original)
+            if future is not None:
+                future.result()
+            elif self._pool is None:
+                self._make_variants(original)
+            found = self.locate(filename)
+            if found is not None:
+                return found
+        return self.locate(original)
+
+    def _original(self, digest):
+        for extension in IMAGE_EXTENSIONS:
+            filename = f"{digest}.{extension}"
+            if self.locate(filename) is not None:
+                return filename
+        return None
+
+    def remove(self, filename):
+        """Delete an original and its variants; returns False if it was kept because it was just uploaded again"""
+        existing = self.locate(filename)
+        if existing is not None and time.time() - os.path.getmtime(os.path.join(self.directory, existing)) < self.GRACE_SECONDS:
+            return False
+        for name in [filename] + list(self.variant_names(filename).values()):
+            for path in (self.shard_path(name), name):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except FileNotFoundError:
+                    pass
+        return True
+
+    def migrate_flat_files(self, progress=None):
+        """Move files of the flat layout into their shard folders; returns how many were moved.
+
+        A file whose shard copy already exists (the same content uploaded
+        again after the switch) is dropped. Temporary files are left alone.
+        progress(moved) is called every 1000 files.
+        """
+        moved = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                    continue
+                target = self._target(entry.name)
+                if os.path.exists(target) and self.is_content_addressed(entry.name):
+                    os.remove(entry.path)
+                else:
+                    os.replace(entry.path, target)
+                moved += 1
+                if progress is not None and moved % 1000 == 0:
+                    progress(moved)
+        return moved
+
+    def sweep(self, referenced, lock, batch_size=500, pause=0.0, progress=None, min_age=0):
+        """Delete upload files no shipment references, one batch at a time.
+
+        Both layouts are swept. referenced() returns the set of referenced
+        file names, without folders. It is called
+        for every batch while holding lock(), which must keep any worker from
+        adding references, and the batch is deleted before the lock is
+        released. Files touched within min_age seconds or GRACE_SECONDS,
+        whichever is longer (an upload not yet linked to its shipment), and
+        temporary files younger than STALE_TEMP_SECONDS (an upload still
+        being written) are kept. progress(counts) is called after every
+        batch. Returns {'scanned', 'deleted', 'reclaimed_bytes'}.
+        """
+        counts = {'scanned': 0, 'deleted': 0, 'reclaimed_bytes': 0}
+        batch = []
+        for path in self._files():
+            batch.append(path)
+            if len(batch) >= batch_size:
+                self._sweep_batch(batch, referenced, lock, counts, min_age)
+                batch = []
+                if progress is not None:
+                    progress(counts)
+                if pause:
+                    time.sleep(pause)
+        if batch:
+            self._sweep_batch(batch, referenced, lock, counts, min_age)
+        if progress is not None:
+            progress(counts)
+        return counts
+
+    def _files(self, folder=''):
+        """Paths below the folder of every stored file, listing one folder at a time"""
+        with os.scandir(os.path.join(self.directory, folder)) as entries:
+            for entry in entries:
+                path = f"{folder}/{entry.name}" if folder else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._files(path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield path
+
+    def _sweep_batch(self, paths, referenced, lock, counts, min_age):
+        counts['scanned'] += len(paths)
+        with lock():
+            in_use = referenced()
+            digests = set()
+            for name in in_use:
+                match = _BLOB_RE.match(name)
+                if match is not None:
+                    digests.add(match.group(1))
+            now = time.time()
+            for path in paths:
+                name = path.rsplit('/', 1)[-1]
+                if name in in_use:
+                    continue
+                match = _BLOB_RE.match(name)
+                if match is not None and match.group(2) is not None and match.group(1) in digests:
+                    continue  # a variant of a referenced original
+                path = os.path.join(self.directory, path)
+                try:
+                    st = os.stat(path)
+                    keep_for = max(min_age, self.STALE_TEMP_SECONDS if name.startswith('.') else self.GRACE_SECONDS)
+                    if now - st.st_mtime < keep_for:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                counts['deleted'] += 1
+                counts['reclaimed_bytes'] += st.st_size
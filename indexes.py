@@ -0,0 +1,543 @@
+import base64
+import bisect
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+
+# Fields the listing can filter on by exact (case-insensitive) match
+FILTER_FIELDS = ['status', 'city', 'state']
+# Fields the listing can sort on; delivery_date also serves range filters
+SORT_FIELDS = ['tracking_id', 'name', 'delivery_date', 'last_updated', 'created_at']
+# Fields searched by /api/tracking/search
+SEARCH_FIELDS = ['name', 'address', 'city', 'state', 'zip']
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(entry):
+    return base64.urlsafe_b64encode(json.dumps(list(entry)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        value, tracking_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (str(value), str(tracking_id))
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+
+
+def _filter_key(value):
+    return str(value or '').strip().lower()
+
+
+def _sort_key(field, tracking_id, record):
+    if field == 'tracking_id':
+        return tracking_id
+    if field == 'name':
+        return str(record.get('name') or '').lower()
+    return str(record.get(field) or '')
+
+
+class ShipmentIndex:
+    """Secondary indexes over shipments for filtered, sorted, cursor-paginated listing.
+
+    Kept current as a store listener. Equality filters are served from
+    value -> tracking IDs maps and ordering from sorted (value, tracking_id)
+    lists, so a page costs O(page size + log n) instead of a scan. Changes
+    reach the sorted lists on the next query: a few are inserted one by one,
+    a large batch such as a bulk ingest or a full reload is merged with one sort.
+    """
+
+    # Past this many pending changes a re-sort is cheaper than inserting them one by one
+    MERGE_BY_SORT = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._by_value = {field: {} for field in FILTER_FIELDS}
+        self._sorted = {field: [] for field in SORT_FIELDS}
+        self._added = {}
+        self._removed = []
+
+    def on_change(self, tracking_id, record):
+        with self._lock:
+            old = self._entries.pop(tracking_id, None)
+            if old is not None:
+                for field in FILTER_FIELDS:
+                    ids = self._by_value[field].get(old[field])
+                    ids.discard(tracking_id)
+                    if not ids:
+                        del self._by_value[field][old[field]]
+                # An entry still waiting to be merged never reached the sorted lists
+                if self._added.pop(tracking_id, None) is None:
+                    self._removed.append((tracking_id, old))
+            if record is None:
+                return
+            entry = {field: _filter_key(record.get(field)) for field in FILTER_FIELDS}
+            for field in FILTER_FIELDS:
+                self._by_value[field].setdefault(entry[field], set()).add(tracking_id)
+            for field in SORT_FIELDS:
+                entry[field] = _sort_key(field, tracking_id, record)
+            self._entries[tracking_id] = entry
+            self._added[tracking_id] = entry
+
+    def _merge_pending(self):
+        if not self._added and not self._removed:
+            return
+        if len(self._added) + len(self._removed) > self.MERGE_BY_SORT:
+            for field in SORT_FIELDS:
+                removed = {(old[field], tracking_id) for tracking_id, old in self._removed}
+                entries = [e for e in self._sorted[field] if e not in removed] if removed else self._sorted[field]
+                entries.extend((entry[field], tracking_id) for tracking_id, entry in self._added.items())
+                entries.sort()
+                self._sorted[field] = entries
+        else:
+            for field in SORT_FIELDS:
+                entries = self._sorted[field]
+                for tracking_id, old in self._removed:
+                    i = bisect.bisect_left(entries, (old[field], tracking_id))
+                    if i < len(entries) and entries[i] == (old[field], tracking_id):
+                        del entries[i]
+                for tracking_id, entry in self._added.items():
+                    bisect.insort(entries, (entry[field], tracking_id))
+        self._added.clear()
+        self._removed.clear()
+
+    def query(self, filters, sort='tracking_id', descending=False, cursor=None, limit=50):
+        """Return (tracking IDs for one page, cursor for the next page or None, total matches)"""
+        after = decode_cursor(cursor) if cursor else None
+        low = filters.get('delivery_from') or None
+        high = filters.get('delivery_to') or None
+
+        with self._lock:
+            self._merge_pending()
+            candidates = self._filtered(filters)
+
+            def in_range(tracking_id):
+                date = self._entries[tracking_id]['delivery_date']
+                return (low is None or date >= low) and (high is None or date <= high)
+
+            entries = self._sorted[sort]
+            if candidates is not None and len(candidates) * 8 < len(entries):
+                # Selective filters: sorting the few matches beats walking the whole index
+                pool = sorted((self._entries[t][sort], t) for t in candidates if in_range(t))
+                total = len(pool)
+                matches = self._walk(pool, after, descending, lambda t: True, 0, len(pool))
+            else:
+                total = self._count(candidates, in_range, low, high, len(entries))
+                lo, hi = 0, len(entries)
+                if sort == 'delivery_date':
+                    lo, hi = self._date_bounds(low, high)
+                matches = self._walk(entries, after, descending,
+                                     lambda t: (candidates is None or t in candidates) and in_range(t), lo, hi)
+
+            page = []
+            for entry in matches:
+                page.append(entry)
+                if len(page) > limit:
+                    break
+
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return [tracking_id for _, tracking_id in page[:limit]], next_cursor, total
+
+    def matching(self, filters):
+        """Return the set of tracking IDs passing the filters, in no particular order"""
+        low = filters.get('delivery_from') or None
+        high = filters.get('delivery_to') or None
+        with self._lock:
+            candidates = self._filtered(filters)
+            if candidates is None:
+                if low is None and high is None:
+                    return set(self._entries)
+                candidates = self._entries
+            return {t for t in candidates if (low is None or self._entries[t]['delivery_date'] >= low)
+                    and (high is None or self._entries[t]['delivery_date'] <= high)}
+
+    def _filtered(self, filters):
+        """Tracking IDs matching every equality filter given, or None when there are none"""
+        candidates = None
+        for field in FILTER_FIELDS:
+            if filters.get(field):
+                ids = self._by_value[field].get(_filter_key(filters[field]), set())
+                candidates = set(ids) if candidates is None else candidates & ids
+        return candidates
+
+    def _walk(self, entries, after, descending, matches, lo, hi):
+        """Yield matching entries in order, starting after the cursor entry, within entries[lo:hi]"""
+        if descending:
+            start = min(hi, bisect.bisect_left(entries, after)) if after else hi
+            positions = range(start - 1, lo - 1, -1)
+        else:
+            start = max(lo, bisect.bisect_right(entries, after)) if after else lo
+            positions = range(start, hi)
+        for i in positions:
+            if matches(entries[i][1]):
+                yield entries[i]
+
+    def _count(self, candidates, in_range, low, high, size):
+        if candidates is not None:
+            return sum(1 for t in candidates if in_range(t))
+        if low is None and high is None:
+            return size
+        start, end = self._date_bounds(low, high)
+        return max(0, end - start)
+
+    def _date_bounds(self, low, high):
+        """Positions in the delivery_date index covering [low, high], both inclusive"""
+        dates = self._sorted['delivery_date']
+        start = bisect.bisect_left(dates, (low,)) if low is not None else 0
+        end = bisect.bisect_left(dates, (high + '\uffff',)) if high is not None else len(dates)
+        return start, end
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text or '').lower())
+
+
+class SearchIndex:
+    """Prefix search over recipient, address and tracking ID words.
+
+    An inverted index maps every word to the tracking IDs containing it, and
+    a sorted vocabulary finds the words starting with a prefix by binary
+    search. Words from new records are merged into the vocabulary on the next
+    query, so a full reload costs one sort instead of an insert per word.
+    """
+
+    # Past this many unmerged words a re-sort is cheaper than inserting them one by one
+    MERGE_BY_SORT = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._tokens = {}
+        self._vocabulary = []
+        self._pending = set()
+
+    def on_change(self, tracking_id, record):
+        tokens = set()
+        if record is not None:
+            tokens.update(tokenize(tracking_id))
+            for field in SEARCH_FIELDS:
+                tokens.update(tokenize(record.get(field)))
+        with self._lock:
+            old = self._tokens.pop(tracking_id, set())
+            for token in old - tokens:
+                ids = self._postings[token]
+                ids.discard(tracking_id)
+                if not ids:
+                    # Left in the vocabulary until the next re-sort; lookups skip it
+                    del self._postings[token]
+            for token in tokens - old:
+                ids = self._postings.get(token)
+                if ids is None:
+                    ids = self._postings[token] = set()
+                    self._pending.add(token)
+                ids.add(tracking_id)
+            if tokens:
+                self._tokens[tracking_id] = tokens
+
+    def search(self, query, limit=20):
+        """Return up to limit tracking IDs matching every word of query as a prefix"""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            self._merge_pending()
+            # Walk the postings of the rarest prefix and check the others per record
+            driver = min(terms, key=self._span)
+            others = [term for term in terms if term != driver]
+            results = []
+            seen = set()
+            for token in self._words_with_prefix(driver):
+                for tracking_id in self._postings.get(token, ()):
+                    if tracking_id in seen:
+                        continue
+                    seen.add(tracking_id)
+                    words = self._tokens[tracking_id]
+                    if all(any(word.startswith(term) for word in words) for term in others):
+                        results.append(tracking_id)
+                        if len(results) >= limit:
+                            return results
+            return results
+
+    def _span(self, prefix):
+        """Number of vocabulary words starting with prefix; a cheap stand-in for how many records match"""
+        return (bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+                - bisect.bisect_left(self._vocabulary, prefix))
+
+    def _words_with_prefix(self, prefix):
+        vocabulary = self._vocabulary
+        i = bisect.bisect_left(vocabulary, prefix)
+        while i < len(vocabulary) and vocabulary[i].startswith(prefix):
+            yield vocabulary[i]
+            i += 1
+
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        if len(self._pending) > self.MERGE_BY_SORT:
+            self._vocabulary = sorted(self._postings)
+        else:
+            for token in self._pending:
+                i = bisect.bisect_left(self._vocabulary, token)
+                if i == len(self._vocabulary) or self._vocabulary[i] != token:
+                    self._vocabulary.insert(i, token)
+        self._pending.clear()
+
+
+class ImageIndex:
+    """Which shipments reference each image URL.
+
+    Uploads are stored once per content, so one file can back several
+    shipments; it may only be deleted once nothing references it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._urls = {}
+        self._references = {}
+
+    def on_change(self, tracking_id, record):
+        url = record.get('image_url') if record is not None else None
+        with self._lock:
+            old = self._urls.pop(tracking_id, None)
+            if old is not None:
+                ids = self._references[old]
+                ids.discard(tracking_id)
+                if not ids:
+                    del self._references[old]
+            if url:
+                self._urls[tracking_id] = url
+                self._references.setdefault(url, set()).add(tracking_id)
+
+    def is_referenced(self, url):
+        with self._lock:
+            return url in self._references
+
+    def urls(self):
+        """Every image URL some shipment references"""
+        with self._lock:
+            return set(self._references)
+
+
+EARTH_RADIUS_KM = 6371.0088
+# Map clusters: grid cells across one 256px web map tile, so a cluster covers about 64px
+CLUSTER_CELLS_PER_TILE = 4
+
+
+def haversine_km(lat1, long1, lat2, long2):
+    lat1, long1, lat2, long2 = map(math.radians, (lat1, long1, lat2, long2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((long2 - long1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cluster_size(zoom):
+    """Degrees spanned by one cluster cell at a web map zoom level"""
+    return 360.0 / (2 ** zoom * CLUSTER_CELLS_PER_TILE)
+
+
+def current_position(record):
+    """(lat, long, city) of a shipment's latest location, or None if it has no usable one"""
+    if record is None:
+        return None
+    if hasattr(record, 'latest_location'):
+        point = record.latest_location()
+    else:
+        locations = record.get('locations')
+        point = locations[0] if locations else None
+    if not isinstance(point, dict):
+        return None
+    lat, long = point.get('lat'), point.get('long')
+    if isinstance(lat, bool) or isinstance(long, bool) or not isinstance(lat, (int, float)) \
+            or not isinstance(long, (int, float)) or not (-90 <= lat <= 90) or not (-180 <= long <= 180):
+        return None
+    return float(lat), float(long), point.get('city')
+
+
+class GeoIndex:
+    """Grid index over each shipment's latest position for bounding-box and radius queries.
+
+    Positions are bucketed into cell_size-degree cells. A query visits the
+    cells overlapping its box, or only the occupied cells when the box spans
+    more cells than that, so a viewport over a whole continent costs no more
+    than a scan of the occupied cells.
+
+    Map clusters are served from per-zoom aggregates (count and coordinate
+    sums per cell) built on first use. The cached_zooms most recently used
+    zoom levels are kept and adjusted in place on every position change.
+    """
+
+    def __init__(self, cell_size=0.1, cached_zooms=8):
+        self.cell_size = cell_size
+        self.cached_zooms = cached_zooms
+        self._lock = threading.Lock()
+        self._positions = {}
+        self._cells = {}
+        self._clusters = OrderedDict()
+        # Small integer per positioned shipment; a cluster of one sums to its member's
+        self._handles = {}
+        self._handle_ids = []
+        self._free_handles = []
+
+    def _cell(self, lat, long):
+        return (math.floor(lat / self.cell_size), math.floor(long / self.cell_size))
+
+    def on_change(self, tracking_id, record):
+        position = current_position(record)
+        with self._lock:
+            old = self._positions.pop(tracking_id, None)
+            if old is not None:
+                cell = self._cell(old[0], old[1])
+                ids = self._cells[cell]
+                ids.discard(tracking_id)
+                if not ids:
+                    del self._cells[cell]
+                self._aggregate(old, self._handles[tracking_id], -1)
+                if position is None:
+                    self._free_handles.append(self._handles.pop(tracking_id))
+            if position is not None:
+                self._positions[tracking_id] = position
+                self._cells.setdefault(self._cell(position[0], position[1]), set()).add(tracking_id)
+                handle = self._handles.get(tracking_id)
+                if handle is None:
+                    handle = self._handles[tracking_id] = self._new_handle(tracking_id)
+                self._aggregate(position, handle, 1)
+
+    def _new_handle(self, tracking_id):
+        if self._free_handles:
+            handle = self._free_handles.pop()
+            self._handle_ids[handle] = tracking_id
+        else:
+            handle = len(self._handle_ids)
+            self._handle_ids.append(tracking_id)
+        return handle
+
+    def _aggregate(self, position, handle, sign):
+        for zoom, cells in self._clusters.items():
+            self._add_to_cluster(cells, _cluster_size(zoom), position, handle, sign)
+
+    @staticmethod
+    def _add_to_cluster(cells, size, position, handle, sign):
+        lat, long = position[0], position[1]
+        cell = (math.floor(lat / size), math.floor(long / size))
+        totals = cells.get(cell)
+        if totals is None:
+            totals = cells[cell] = [0, 0.0, 0.0, 0]
+        totals[0] += sign
+        if not totals[0]:
+            del cells[cell]
+            return
+        totals[1] += sign * lat
+        totals[2] += sign * long
+        totals[3] += sign * handle
+
+    def _build_clusters(self, size):
+        cells = {}
+        floor, handles = math.floor, self._handles
+        for tracking_id, (lat, long, _) in self._positions.items():
+            cell = (floor(lat / size), floor(long / size))
+            totals = cells.get(cell)
+            if totals is None:
+                cells[cell] = [1, lat, long, handles[tracking_id]]
+            else:
+                totals[0] += 1
+                totals[1] += lat
+                totals[2] += long
+                totals[3] += handles[tracking_id]
+        return cells
+
+    def clusters(self, zoom, south, west, north, east):
+        """Clusters in the box at a web map zoom level as (lat, long, count, tracking_id), lat/long the centroid.
+
+        tracking_id names the shipment of a cluster of one and is None otherwise.
+        west > east crosses the antimeridian.
+        """
+        boxes = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+        size = _cluster_size(zoom)
+        with self._lock:
+            cells = self._clusters.get(zoom)
+            if cells is None:
+                cells = self._build_clusters(size)
+                self._clusters[zoom] = cells
+                if len(self._clusters) > self.cached_zooms:
+                    self._clusters.popitem(last=False)
+            else:
+                self._clusters.move_to_end(zoom)
+
+            found = []
+            low_row, high_row = math.floor(south / size), math.floor(north / size)
+            for west, east in boxes:
+                low_col, high_col = math.floor(west / size), math.floor(east / size)
+                if (high_row - low_row + 1) * (high_col - low_col + 1) > len(cells):
+                    matches = ((cell, totals) for cell, totals in cells.items()
+                               if low_row <= cell[0] <= high_row and low_col <= cell[1] <= high_col)
+                else:
+                    matches = (((row, col), cells[(row, col)])
+                               for row in range(low_row, high_row + 1) for col in range(low_col, high_col + 1)
+                               if (row, col) in cells)
+                for _, (count, lat_sum, long_sum, handle_sum) in matches:
+                    tracking_id = self._handle_ids[handle_sum] if count == 1 else None
+                    found.append((lat_sum / count, long_sum / count, count, tracking_id))
+            return found
+
+    def within(self, south, west, north, east, limit=None):
+        """Shipments inside the box as (tracking_id, lat, long, city); west > east crosses the antimeridian"""
+        if west > east:
+            found = self.within(south, west, north, 180, limit)
+            if limit is None or len(found) < limit:
+                found += self.within(south, -180, north, east, None if limit is None else limit - len(found))
+            return found
+        with self._lock:
+            found = []
+            for tracking_id in self._candidates(south, west, north, east):
+                lat, long, city = self._positions[tracking_id]
+                if south <= lat <= north and west <= long <= east:
+                    found.append((tracking_id, lat, long, city))
+                    if limit is not None and len(found) >= limit:
+                        break
+            return found
+
+    def nearby(self, lat, long, radius_km, limit=None):
+        """Shipments within radius_km of a point as (tracking_id, lat, long, city, distance_km), nearest first"""
+        lat_span = math.degrees(radius_km / EARTH_RADIUS_KM)
+        south, north = max(-90.0, lat - lat_span), min(90.0, lat + lat_span)
+        cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+        if north >= 90 or south <= -90 or cos_lat <= 0 or lat_span / cos_lat >= 180:
+            boxes = [(-180.0, 180.0)]
+        else:
+            west, east = long - lat_span / cos_lat, long + lat_span / cos_lat
+            if west < -180:
+                boxes = [(west + 360, 180.0), (-180.0, east)]
+            elif east > 180:
+                boxes = [(west, 180.0), (-180.0, east - 360)]
+            else:
+                boxes = [(west, east)]
+
+        with self._lock:
+            found = []
+            for west, east in boxes:
+                for tracking_id in self._candidates(south, west, north, east):
+                    p_lat, p_long, city = self._positions[tracking_id]
+                    distance = haversine_km(lat, long, p_lat, p_long)
+                    if distance <= radius_km:
+                        found.append((tracking_id, p_lat, p_long, city, distance))
+        found.sort(key=lambda item: item[4])
+        return found[:limit] if limit is not None else found
+
+    def _candidates(self, south, west, north, east):
+        (low_row, low_col), (high_row, high_col) = self._cell(south, west), self._cell(north, east)
+        if (high_row - low_row + 1) * (high_col - low_col + 1) > len(self._cells):
+            cells = (ids for (row, col), ids in self._cells.items()
+                     if low_row <= row <= high_row and low_col <= col <= high_col)
+        else:
+            cells = (self._cells.get((row, col), ())
+                     for row in range(low_row, high_row + 1) for col in range(low_col, high_col + 1))
+        for ids in cells:
+            yield from ids
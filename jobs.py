@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from storage import atomic_write_json
+
+
+class Job:
+    """Handle a background task uses to report its progress"""
+
+    def __init__(self, tracker, job_id, kind, params):
+        self.tracker = tracker
+        self.state = {
+            'job_id': job_id,
+            'kind': kind,
+            'params': params,
+            'status': 'running',
+            'phase': 'starting',
+            'done': 0,
+            'total': None,
+            'result': None,
+            'error': None,
+            'started_at': str(datetime.now()),
+            'finished_at': None
+        }
+        self._written_at = 0
+
+    def progress(self, done=None, total=None, phase=None):
+        """Record progress; written out at most every progress_interval seconds"""
+        if done is not None:
+            self.state['done'] = done
+        if total is not None:
+            self.state['total'] = total
+        if phase is not None:
+            self.state['phase'] = phase
+        now = time.monotonic()
+        if phase is not None or now - self._written_at >= self.tracker.progress_interval:
+            self._written_at = now
+            self.tracker._write(self.state)
+
+    def finish(self, result=None, error=None):
+        self.state['status'] = 'failed' if error else 'done'
+        self.state['phase'] = self.state['status']
+        self.state['result'] = result
+        self.state['error'] = error
+        self.state['finished_at'] = str(datetime.now())
+        self.tracker._write(self.state)
+
+
+class JobTracker:
+    """Runs long tasks on background threads, with progress visible to every worker.
+
+    Each job's state is a small JSON file in directory, rewritten atomically
+    as the job advances, so any gunicorn worker can answer a status request
+    for a job another worker runs. Files of jobs older than retention seconds
+    are removed when a new job starts.
+    """
+
+    def __init__(self, directory, retention=86400, progress_interval=0.5):
+        self.directory = directory
+        self.retention = retention
+        self.progress_interval = progress_interval
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _write(self, state):
+        atomic_write_json(self._path(state['job_id']), state, indent=None)
+
+    def start(self, kind, work, params=None):
+        """Run work(job) on a background thread; its return value becomes the job's result"""
+        self._prune()
+        job = Job(self, uuid.uuid4().hex, kind, params)
+        self._write(job.state)
+
+        def run():
+            try:
+                result = work(job)
+            except Exception as e:
+                print(f"❌ Job {job.state['job_id']} ({kind}) failed: {e}")
+                job.finish(error=str(e))
+            else:
+                job.finish(result=result)
+
+        threading.Thread(target=run, name=f'job-{kind}', daemon=True).start()
+        return dict(job.state)
+
+    def get(self, job_id):
+        """Return a job's state, or None if it is unknown or expired"""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,165 @@
+import codecs
+import json
+
+# Top-level keys of the tracking_data.json layout that do not hold shipments
+LAYOUT_KEYS = {'system_stats', 'export_date', 'total_records'}
+# Single-character escapes inside JSON strings
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class _Reader:
+    """Incremental tokenizer over a text stream, holding only the unparsed tail in memory"""
+
+    def __init__(self, stream, chunk_size, max_value_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        data = self.stream.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(b'', final=True)
+        else:
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(data)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or '' at the end"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char == '' or char not in chars:
+            raise ValueError(f"Expected {' or '.join(repr(c) for c in chars)}, found {char or 'end of data'!r}")
+        self.pos += 1
+        return char
+
+    def string_chunks(self):
+        """Yield the next JSON string piece by piece, unescaped, without holding it whole"""
+        self.expect('"')
+        quote = backslash = None
+        while True:
+            # Positions of the next quote and backslash, found again only once passed
+            if quote is None or quote < self.pos:
+                quote = self.buffer.find('"', self.pos)
+                quote = len(self.buffer) if quote < 0 else quote
+            if backslash is None or backslash < self.pos:
+                backslash = self.buffer.find('\\', self.pos)
+                backslash = len(self.buffer) if backslash < 0 else backslash
+            end = min(quote, backslash)
+            if end > self.pos:
+                yield self.buffer[self.pos:end]
+                self.pos = end
+            if end == len(self.buffer):
+                if not self._fill():
+                    raise ValueError("Unterminated string")
+                quote = backslash = None
+                continue
+            if end == quote:
+                self.pos = end + 1
+                return
+            # An escape sequence; make sure all of it is buffered
+            if len(self.buffer) - self.pos < 6:
+                while len(self.buffer) - self.pos < 6 and self._fill():
+                    pass
+                quote = backslash = None
+            escape = self.buffer[self.pos + 1:self.pos + 2]
+            if escape == 'u':
+                try:
+                    yield chr(int(self.buffer[self.pos + 2:self.pos + 6], 16))
+                except ValueError:
+                    raise ValueError("Invalid \\u escape in string")
+                self.pos += 6
+            elif escape in _ESCAPES:
+                yield _ESCAPES[escape]
+                self.pos += 2
+            else:
+                raise ValueError("Invalid escape in string")
+
+    def value(self):
+        """Decode one complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next read
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if len(self.buffer) - self.pos > self.max_value_size:
+                raise ValueError(f"JSON value larger than {self.max_value_size} bytes")
+            self._fill()
+
+
+def iter_shipments(stream, chunk_size=64 * 1024, max_value_size=1024 * 1024):
+    """Yield (tracking_id, record) pairs from a JSON upload without parsing it whole.
+
+    Accepts the tracking_data.json layout ({"tracking_ids": {...}, ...}) or a
+    bare {tracking_id: record} mapping. Only one record is held in memory at
+    a time; a syntax error raises ValueError after the records before it
+    have been yielded.
+    """
+    reader = _Reader(stream, chunk_size, max_value_size)
+    reader.expect('{')
+    for key in _object_keys(reader):
+        if key == 'tracking_ids':
+            reader.expect('{')
+            for tracking_id in _object_keys(reader):
+                yield tracking_id, reader.value()
+        elif key in LAYOUT_KEYS:
+            reader.value()
+        else:
+            yield key, reader.value()
+    if reader.peek() != '':
+        raise ValueError("Unexpected data after the end of the JSON document")
+
+
+def iter_string_field(stream, field, chunk_size=64 * 1024, max_value_size=1024 * 1024):
+    """Yield the string value of one field of a JSON object upload in pieces.
+
+    Other fields before it are parsed and skipped; the rest of the document
+    is not read. Raises ValueError if the field is missing or not a string.
+    """
+    reader = _Reader(stream, chunk_size, max_value_size)
+    reader.expect('{')
+    for key in _object_keys(reader):
+        if key == field:
+            if reader.peek() != '"':
+                raise ValueError(f"{field} must be a string")
+            yield from reader.string_chunks()
+            return
+        reader.value()
+    raise ValueError(f"Missing {field}")
+
+
+def _object_keys(reader):
+    """Yield the keys of the object just opened; the caller consumes each value"""
+    if reader.peek() == '}':
+        reader.pos += 1
+        return
+    while True:
+        if reader.peek() != '"':
+            raise ValueError("Expected an object key")
+        key = reader.value()
+        reader.expect(':')
+        yield key
+        if reader.expect(',}') == '}':
+            return
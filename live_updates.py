@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+
+
+class Subscription:
+    """One open event stream; only the latest state of its shipment is kept"""
+
+    def __init__(self, tracking_id):
+        self.tracking_id = tracking_id
+        self._latest = None
+        self._event = threading.Event()
+
+    def push(self, record):
+        self._latest = record
+        self._event.set()
+
+    def wait(self, timeout):
+        """Return the newest record published since the last call, or None on timeout"""
+        if not self._event.wait(timeout):
+            return None
+        self._event.clear()
+        record, self._latest = self._latest, None
+        return record
+
+
+class EventStream:
+    """Response body of one event stream; closing it frees the stream's slot"""
+
+    def __init__(self, events, on_close):
+        self._events = events
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._events.close()
+            self._on_close()
+
+
+class LiveUpdates:
+    """Fans shipment changes out to Server-Sent Events subscribers in this worker.
+
+    The store notifies us of every record it changes, whether the write was
+    made here or picked up from another worker. While anyone is subscribed a
+    watcher thread asks the store to catch up every poll_interval seconds, so
+    writes made by other gunicorn workers reach this worker's streams too.
+
+    Every open stream holds a worker thread, so at most max_streams are open
+    at once; beyond that stream() refuses and clients poll instead.
+    """
+
+    def __init__(self, store, poll_interval=1.0, max_streams=None):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._streams = 0
+        self._watcher = None
+        store.add_listener(self.publish)
+
+    def publish(self, tracking_id, record):
+        subscribers = self._subscribers.get(tracking_id)
+        if not subscribers:
+            return
+        with self._lock:
+            subscribers = list(subscribers)
+        for subscription in subscribers:
+            subscription.push(record)
+
+    def subscribe(self, tracking_id):
+        subscription = Subscription(tracking_id)
+        with self._lock:
+            self._subscribers.setdefault(tracking_id, set()).add(subscription)
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, name='live-updates', daemon=True)
+                self._watcher.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.tracking_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.tracking_id]
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._watcher = None
+                    return
+            try:
+                self.store.refresh()
+            except Exception as e:
+                print(f"⚠️ Live updates could not refresh the store: {e}")
+
+    def stream(self, tracking_id, record, tick=15, max_duration=300, on_tick=None):
+        """Server-Sent Events for one shipment, or None if max_streams are already open.
+
+        The current state is sent first; after that an event is only sent when
+        the shipment's location, status or delivery date changes. A comment
+        line is sent every tick seconds to keep proxies from closing the
+        connection, and on_tick() runs at the same cadence. The stream ends
+        after max_duration seconds; EventSource clients reconnect by themselves.
+        """
+        with self._lock:
+            if self.max_streams is not None and self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+        return EventStream(self._events(tracking_id, record, tick, max_duration, on_tick), self._release)
+
+    def _release(self):
+        with self._lock:
+            self._streams -= 1
+
+    def _events(self, tracking_id, record, tick, max_duration, on_tick):
+        subscription = self.subscribe(tracking_id)
+        try:
+            yield 'retry: 3000\n\n'
+            last_sent = None
+            deadline = time.monotonic() + max_duration
+            while True:
+                if record is not None:
+                    key = _change_key(record)
+                    if key != last_sent:
+                        last_sent = key
+                        yield f"data: {json.dumps({'success': True, **record})}\n\n"
+                    record = None
+                elif time.monotonic() >= deadline:
+                    return
+                else:
+                    record = subscription.wait(tick)
+                    if record is None:
+                        if on_tick is not None:
+                            on_tick()
+                        yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+def _change_key(record):
+    locations = record.get('locations') or [{}]
+    return (json.dumps(locations[0], sort_keys=True), record.get('status'), record.get('delivery_date'))
@@ -0,0 +1,70 @@
+"""Move uploaded images into the sharded uploads layout and point shipments at them.
+
+Uploads used to sit directly in the uploads folder; new ones are stored in
+<ab>/<cd>/ subfolders (see ImageStore.shard_path()). This moves the existing
+files into their subfolders, then rewrites the image_url and image_variants
+of every shipment that still uses a flat /uploads/<name> URL, all in one save.
+
+It works on the app's data directory, which is the current working directory
+(except on PythonAnywhere, see get_deployment_config() in server.py), so run
+it from where the app runs, with the same environment (STORAGE_BACKEND, ...).
+It is meant to run while the app is stopped. Both layouts are served throughout,
+so a running app keeps working and an interrupted run can simply be repeated.
+
+Usage: python migrate_uploads.py [--dry-run]
+"""
+import argparse
+import os
+import sys
+
+
+def sharded_url(image_store, url):
+    """The fan-out URL for a flat /uploads/<name> URL; any other URL is returned unchanged"""
+    if not isinstance(url, str) or not url.startswith('/uploads/'):
+        return url
+    name = url[len('/uploads/'):]
+    if '/' in name:
+        return url
+    return f'/uploads/{image_store.shard_path(name)}'
+
+
+def rewrite(image_store, record):
+    """Point a shipment's image URLs at the fan-out layout; True if anything changed"""
+    changed = False
+    if 'image_url' in record:
+        url = sharded_url(image_store, record['image_url'])
+        changed = url != record['image_url']
+        record['image_url'] = url
+    variants = record.get('image_variants')
+    if isinstance(variants, dict):
+        for variant, url in variants.items():
+            new_url = sharded_url(image_store, url)
+            if new_url != url:
+                variants[variant] = new_url
+                changed = True
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--dry-run', action='store_true', help='only count what would change')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from server import image_store, store
+
+    if args.dry_run:
+        with os.scandir(image_store.directory) as entries:
+            flat = sum(1 for entry in entries if not entry.name.startswith('.') and entry.is_file(follow_symlinks=False))
+        records = sum(1 for record in store.records().values() if rewrite(image_store, record.to_dict()))
+        print(f"🔍 {flat} files to move, {records} shipments to update")
+        return
+
+    moved = image_store.migrate_flat_files(progress=lambda moved: print(f"   … {moved} files moved"))
+    print(f"📦 Moved {moved} files into {image_store.directory}/<ab>/<cd>/")
+    updated = store.update_all(lambda record: rewrite(image_store, record))
+    print(f"✅ Updated image URLs of {updated} shipments")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import atexit
+import threading
+from datetime import datetime
+
+
+def parse_ping(ping):
+    """Validate one GPS ping; returns (tracking_id, point) or raises ValueError with the reason.
+
+    Coordinates get the same bounds as /api/config/location. timestamp may be
+    an ISO 8601 string or Unix seconds and defaults to the time of receipt.
+    """
+    if not isinstance(ping, dict):
+        raise ValueError('Each ping must be a JSON object')
+    tracking_id = ping.get('tracking_id')
+    if not isinstance(tracking_id, str) or not tracking_id:
+        raise ValueError('Missing tracking_id')
+    if 'lat' not in ping or 'long' not in ping:
+        raise ValueError('Missing required fields: lat, long')
+    try:
+        lat = float(ping['lat'])
+        long = float(ping['long'])
+    except (TypeError, ValueError):
+        raise ValueError('Invalid coordinates. Must be numbers')
+    if not (-90 <= lat <= 90):
+        raise ValueError('Latitude must be between -90 and 90')
+    if not (-180 <= long <= 180):
+        raise ValueError('Longitude must be between -180 and 180')
+
+    timestamp = ping.get('timestamp')
+    if timestamp is None:
+        recorded_at = datetime.now()
+    elif isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        try:
+            recorded_at = datetime.fromtimestamp(timestamp)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError('timestamp must be ISO 8601 or Unix seconds')
+    elif isinstance(timestamp, str):
+        try:
+            recorded_at = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError('timestamp must be ISO 8601 or Unix seconds')
+        if recorded_at.tzinfo is not None:
+            # Stored timestamps are local time without an offset, like last_updated
+            recorded_at = recorded_at.astimezone().replace(tzinfo=None)
+    else:
+        raise ValueError('timestamp must be ISO 8601 or Unix seconds')
+
+    point = {'city': str(ping.get('city') or ''), 'lat': lat, 'long': long, 'timestamp': str(recorded_at)}
+    return tracking_id, point
+
+
+def _newest_first(point):
+    # Points recorded before pings carried timestamps sort after every timestamped one
+    timestamp = point.get('timestamp')
+    return (timestamp is not None, timestamp or '')
+
+
+class PingBuffer:
+    """Collects GPS pings in memory and writes them to the store in batches.
+
+    Pings for the same shipment are coalesced, so a flush costs one record
+    write per shipment and one save for the whole batch however many pings
+    arrived. A background thread flushes every flush_interval seconds, or as
+    soon as max_pending pings are waiting. Buffered pings are lost if the
+    process dies before the next flush.
+    """
+
+    def __init__(self, store, flush_interval=1.0, max_pending=5000):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._count = 0
+        self._wake = threading.Event()
+        self._flusher = None
+        atexit.register(self.flush)
+
+    def add(self, pings):
+        """Queue (tracking_id, point) pairs; returns the number of pings now waiting"""
+        with self._lock:
+            for tracking_id, point in pings:
+                points = self._pending.setdefault(tracking_id, {})
+                # A repeated ping for the same instant replaces the earlier one
+                if point['timestamp'] not in points:
+                    self._count += 1
+                points[point['timestamp']] = point
+            count = self._count
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._run, name='ping-flusher', daemon=True)
+                self._flusher.start()
+        if count >= self.max_pending:
+            self._wake.set()
+        return count
+
+    def pending(self):
+        return self._count
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Could not flush GPS pings: {e}")
+
+    def flush(self):
+        """Write every buffered ping to the store; returns the number of shipments updated"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._count = self._pending, {}, 0
+            if not batch:
+                return 0
+            now = str(datetime.now())
+
+            def merge(tracking_id, current, points):
+                if current is None:
+                    return None  # deleted since the ping was accepted
+                locations = list(points.values()) + (current.get('locations') or [])
+                locations.sort(key=_newest_first, reverse=True)
+                current['locations'] = locations
+                current['last_updated'] = now
+                return current
+
+            stored = self.store.merge_many(list(batch.items()), merge)
+            if stored is None:
+                # The store dropped the unsaved points; queue them again for the next flush
+                self._requeue(batch)
+                print(f"⚠️ Could not save GPS pings for {len(batch)} shipments, retrying with the next flush")
+                return 0
+            return sum(1 for record in stored if record is not None)
+
+    def _requeue(self, batch):
+        """Put a batch that could not be saved back in front of pings that arrived meanwhile"""
+        with self._lock:
+            for tracking_id, points in batch.items():
+                newer = self._pending.get(tracking_id)
+                if newer is not None:
+                    points.update(newer)
+                self._pending[tracking_id] = points
+            self._count = sum(len(points) for points in self._pending.values())
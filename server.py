@@ -1,14 +1,46 @@
-from flask import Flask, jsonify, request, render_template, send_from_directory
+from flask import Flask, Response, jsonify, request, render_template, send_from_directory
 from flask_cors import CORS
+import csv
+import io
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
-import base64
-from werkzeug.utils import secure_filename
+import time
+import hashlib
+from werkzeug.exceptions import NotFound
 import sys
+import zlib
+import mimetypes
+import shutil
+import threading
+from collections.abc import Mapping
+from store import SaveError, ShipmentStore
+from live_updates import LiveUpdates
+from indexes import SORT_FIELDS, GeoIndex, ImageIndex, InvalidCursor, SearchIndex, ShipmentIndex
+from json_stream import iter_shipments, iter_string_field
+from storage import FileLock, create_backend
+from history import LocationHistory
+from pings import PingBuffer, parse_ping
+from jobs import JobTracker
+from settings import ConfigStore
+from images import Base64Reader, ImageStore, ImageTooLarge
+from flask.json.provider import DefaultJSONProvider
+from compact import CompactShipment
+
+class TrackingJSONProvider(DefaultJSONProvider):
+    """jsonify that also serializes the store's read-only compact records"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, CompactShipment):
+            return o.to_dict()
+        if isinstance(o, Mapping):
+            return dict(o)  # such as the read-only config snapshot
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
+app.json = TrackingJSONProvider(app)
 CORS(app)
 
 # Auto-configure for Render.com deployment
@@ -58,10 +90,89 @@ print(f"🚀 Production mode: {IS_PRODUCTION}")
 
 # File paths
 DATA_FILE = os.path.join(DATA_DIR, 'tracking_data.json')
+DB_FILE = os.path.join(DATA_DIR, 'tracking_data.db')
+HISTORY_DB_FILE = os.path.join(DATA_DIR, 'location_history.db')
 CONFIG_FILE = os.path.join(DATA_DIR, 'system_config.json')
 UPLOAD_FOLDER = os.path.join(DATA_DIR, 'uploads')
+JOBS_DIR = os.path.join(DATA_DIR, 'jobs')
+UPLOADS_GC_STAMP = os.path.join(DATA_DIR, 'uploads-gc.stamp')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+# Storage backend: 'sqlite' writes one row per tracking ID, 'json' rewrites tracking_data.json
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+# JSON backend only: journal entries to accumulate before rewriting the snapshot
+JOURNAL_COMPACT_EVERY = int(os.environ.get('JOURNAL_COMPACT_EVERY', 100))
+# Seconds a worker serves reads from memory before checking storage for other workers' writes
+STORE_REFRESH_INTERVAL = float(os.environ.get('STORE_REFRESH_INTERVAL', 1.0))
+# Location history: points kept at full resolution per shipment, Douglas-Peucker tolerance
+# in metres for older points, the cap on older points, and points kept in the shipment record
+HISTORY_FULL_RESOLUTION = int(os.environ.get('HISTORY_FULL_RESOLUTION', 200))
+HISTORY_TOLERANCE_METERS = float(os.environ.get('HISTORY_TOLERANCE_METERS', 25))
+HISTORY_MAX_POINTS = int(os.environ.get('HISTORY_MAX_POINTS', 1000))
+RECORD_LOCATIONS = int(os.environ.get('RECORD_LOCATIONS', 20))
+# Seconds a /health response is reused for platform probes
+HEALTH_CACHE_TTL = 5
+# Paginated /api/tracking/all listing
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_SEARCH_RESULTS = 100
+# Spatial queries: grid cell size in degrees and result limits
+GEO_CELL_DEGREES = float(os.environ.get('GEO_CELL_DEGREES', 0.1))
+DEFAULT_GEO_RESULTS = 500
+MAX_GEO_RESULTS = 5000
+# Map clusters: highest zoom level served, and zoom levels whose aggregates stay cached
+MAX_CLUSTER_ZOOM = 20
+CLUSTER_CACHED_ZOOMS = int(os.environ.get('CLUSTER_CACHED_ZOOMS', 8))
+# Bulk ingest and import: records committed per save, and import errors listed in the response
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 500))
+MAX_REPORTED_ERRORS = 100
+# GPS pings: seconds between flushes, and buffered pings that trigger an early flush
+PING_FLUSH_INTERVAL = float(os.environ.get('PING_FLUSH_INTERVAL', 1.0))
+PING_FLUSH_THRESHOLD = int(os.environ.get('PING_FLUSH_THRESHOLD', 5000))
+# Threads making thumbnail and preview variants of uploaded images (0: make them on first request)
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+# Largest image accepted, in bytes after base64 decoding
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+# Browser caching of /uploads: content-addressed files never change; others are revalidated after this
+UPLOAD_MAX_AGE = int(os.environ.get('UPLOAD_MAX_AGE', 3600))
+# Let the front proxy send upload bytes: '' (Flask sends them), 'x-sendfile' (Apache, lighttpd)
+# or 'x-accel-redirect' (nginx, with an internal location mapping UPLOADS_ACCEL_PREFIX to the uploads folder)
+UPLOADS_SENDFILE = os.environ.get('UPLOADS_SENDFILE', '').lower()
+UPLOADS_ACCEL_PREFIX = os.environ.get('UPLOADS_ACCEL_PREFIX', '/protected-uploads/')
+# Seconds a missing upload is answered with 404 without looking at the disk, and names remembered
+MISSING_UPLOAD_TTL = 30
+MISSING_UPLOADS_MAX = 10000
+# Orphaned upload cleanup: seconds between automatic sweeps (0: only when an admin asks), files per batch
+UPLOADS_GC_INTERVAL = int(os.environ.get('UPLOADS_GC_INTERVAL', 86400))
+UPLOADS_GC_BATCH = int(os.environ.get('UPLOADS_GC_BATCH', 500))
+# Upload files younger than this many seconds are never swept, whether or not anything references them
+UPLOADS_GC_MIN_AGE = int(os.environ.get('UPLOADS_GC_MIN_AGE', 3600))
+# Background jobs: seconds a finished job's status stays available
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 86400))
+# Filters a bulk relocation can select shipments by
+RELOCATE_FILTERS = ['status', 'city', 'state', 'delivery_from', 'delivery_to', 'within']
+# Streaming export: bytes buffered per chunk sent, and the CSV columns
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_CSV_FIELDS = ['tracking_id', 'name', 'address', 'city', 'state', 'zip', 'status', 'delivery_date',
+                     'created_at', 'last_updated', 'image_url', 'location_city', 'location_lat', 'location_long']
+EXPORT_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# Shipment fields a client may change after creation
+UPDATABLE_FIELDS = ['name', 'address', 'city', 'state', 'zip', 'delivery_date', 'status', 'locations']
+# Shipment fields an import or bulk upload must give as strings when it includes them
+IMPORT_TEXT_FIELDS = ['name', 'address', 'city', 'state', 'zip', 'status', 'delivery_date',
+                      'created_at', 'last_updated', 'image_url']
+LIST_PARAMS = {'limit', 'cursor', 'sort', 'order', 'status', 'city', 'state', 'delivery_from', 'delivery_to'}
+# Live tracking streams: keepalive cadence and lifetime before the browser reconnects
+STREAM_KEEPALIVE = 15
+STREAM_MAX_DURATION = 300
+# Open live tracking streams per worker; each holds a thread, so keep this below gunicorn's --threads
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 16))
+
+# Variants are WebP, which older mimetypes tables lack
+mimetypes.add_type('image/webp', '.webp')
+# With x-sendfile, send_from_directory() leaves the bytes of uploads and static files to the proxy
+app.config['USE_X_SENDFILE'] = UPLOADS_SENDFILE == 'x-sendfile'
+
 # Create necessary directories
 for folder in [UPLOAD_FOLDER, 'templates', 'static']:
     os.makedirs(folder, exist_ok=True)
@@ -70,213 +181,173 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def load_config():
-    """Load system configuration"""
-    default_config = {
-        "default_location": {
-            "city": "Berlin, Germany",
-            "lat": 52.5200,
-            "long": 13.4050
-        },
-        "company_name": "Smart Real-Time Package Tracking",
-        "map_zoom_level": 12,
-        "base_url": BASE_URL,
-        "deployment_mode": "production" if IS_PRODUCTION else "development",
-        "version": "2.0.0",
-        "features": {
-            "image_upload": True,
-            "real_time_updates": True,
-            "admin_dashboard": True,
-            "location_config": True
-        }
+# Configuration served when system_config.json lacks a field
+DEFAULT_CONFIG = {
+    "default_location": {
+        "city": "Berlin, Germany",
+        "lat": 52.5200,
+        "long": 13.4050
+    },
+    "company_name": "Smart Real-Time Package Tracking",
+    "map_zoom_level": 12,
+    "version": "2.0.0",
+    "features": {
+        "image_upload": True,
+        "real_time_updates": True,
+        "admin_dashboard": True,
+        "location_config": True
     }
-    
-    if not os.path.exists(CONFIG_FILE):
-        print(f"📝 Creating new config file at: {CONFIG_FILE}")
-        save_config(default_config)
-        return default_config
-    
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-            # Update base_url if it's old
-            if config.get('base_url') != BASE_URL:
-                config['base_url'] = BASE_URL
-                config['deployment_mode'] = "production" if IS_PRODUCTION else "development"
-                save_config(config)
-                print(f"🔄 Updated config with new base URL: {BASE_URL}")
-            
-            # Ensure new fields exist
-            if 'version' not in config:
-                config['version'] = "2.0.0"
-            if 'features' not in config:
-                config['features'] = default_config['features']
-            
-            return config
-    except Exception as e:
-        print(f"⚠️ Error loading config, using default: {e}")
-        return default_config
+}
+
+# system_config.json, cached in memory and reloaded when the file changes
+config_store = ConfigStore(CONFIG_FILE, DEFAULT_CONFIG, overrides={
+    "base_url": BASE_URL,
+    "deployment_mode": "production" if IS_PRODUCTION else "development"
+}, refresh_interval=STORE_REFRESH_INTERVAL)
+config_store.ensure_file()
+
+def load_config():
+    """Load system configuration as a read-only mapping; never writes"""
+    return config_store.get()
+
+def get_default_location():
+    """Location new shipments start at; the config store fills it in from DEFAULT_CONFIG"""
+    return load_config()['default_location']
 
-def save_config(config):
-    """Save system configuration"""
+def save_config(apply):
+    """Apply apply(config) to a mutable copy of the configuration and save it; returns the new one or None"""
     try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
-        return True
+        return config_store.update(apply)
     except Exception as e:
         print(f"❌ Error saving config: {e}")
-        return False
+        return None
 
-def load_data():
-    """Load tracking data with automatic creation if needed"""
-    if not os.path.exists(DATA_FILE):
-        print(f"📦 Creating new tracking data file at: {DATA_FILE}")
-        
-        # Load system configuration for default location
-        config = load_config()
-        default_location = config.get('default_location', {
-            "city": "Berlin, Germany", 
-            "lat": 52.5200, 
-            "long": 13.4050
-        })
-        
-        # Default data structure with more sample tracking IDs
-        default_data = {
-            "tracking_ids": {
-                "AB123CDE45": {
-                    "name": "Sandra Beasley-Lawson",
-                    "address": "811 Robin Circle",
-                    "city": "Hattiesburg",
-                    "state": "MS",
-                    "zip": "39402",
-                    "delivery_date": str(datetime.now().date()),
-                    "status": "In Transit",
-                    "locations": [default_location],
-                    "created_at": str(datetime.now()),
-                    "last_updated": str(datetime.now()),
-                    "image_url": "/uploads/sample_package.jpg"
-                },
-                "JGD987WQTR": {
-                    "name": "John Doe",
-                    "address": "123 Main Street",
-                    "city": "New York",
-                    "state": "NY",
-                    "zip": "10001",
-                    "delivery_date": str(datetime.now().date()),
-                    "status": "Processing",
-                    "locations": [default_location],
-                    "created_at": str(datetime.now()),
-                    "last_updated": str(datetime.now())
-                },
-                "XYZ789ABCD": {
-                    "name": "Jane Smith",
-                    "address": "456 Oak Avenue",
-                    "city": "Los Angeles",
-                    "state": "CA",
-                    "zip": "90001",
-                    "delivery_date": str((datetime.now().replace(day=datetime.now().day + 3)).date()),
-                    "status": "Out for Delivery",
-                    "locations": [default_location],
-                    "created_at": str(datetime.now()),
-                    "last_updated": str(datetime.now())
-                }
+def create_default_data():
+    """Build the sample dataset used when no tracking data file exists"""
+    default_location = get_default_location()
+
+    # Default data structure with more sample tracking IDs
+    default_data = {
+        "tracking_ids": {
+            "AB123CDE45": {
+                "name": "Sandra Beasley-Lawson",
+                "address": "811 Robin Circle",
+                "city": "Hattiesburg",
+                "state": "MS",
+                "zip": "39402",
+                "delivery_date": str(datetime.now().date()),
+                "status": "In Transit",
+                "locations": [dict(default_location)],
+                "created_at": str(datetime.now()),
+                "last_updated": str(datetime.now()),
+                "image_url": "/uploads/sample_package.jpg"
+            },
+            "JGD987WQTR": {
+                "name": "John Doe",
+                "address": "123 Main Street",
+                "city": "New York",
+                "state": "NY",
+                "zip": "10001",
+                "delivery_date": str(datetime.now().date()),
+                "status": "Processing",
+                "locations": [dict(default_location)],
+                "created_at": str(datetime.now()),
+                "last_updated": str(datetime.now())
             },
-            "system_stats": {
-                "total_tracking_ids": 3,
-                "active_shipments": 3,
-                "delivered_today": 0,
-                "images_count": 1,
+            "XYZ789ABCD": {
+                "name": "Jane Smith",
+                "address": "456 Oak Avenue",
+                "city": "Los Angeles",
+                "state": "CA",
+                "zip": "90001",
+                "delivery_date": str((datetime.now().replace(day=datetime.now().day + 3)).date()),
+                "status": "Out for Delivery",
+                "locations": [dict(default_location)],
+                "created_at": str(datetime.now()),
                 "last_updated": str(datetime.now())
             }
+        },
+        "system_stats": {
+            "total_tracking_ids": 3,
+            "active_shipments": 3,
+            "delivered_today": 0,
+            "images_count": 1,
+            "last_updated": str(datetime.now())
         }
-        
-        # Create a sample image file if it doesn't exist
-        sample_image_path = os.path.join(UPLOAD_FOLDER, 'sample_package.jpg')
-        if not os.path.exists(sample_image_path):
-            try:
-                # Try to create a simple placeholder image
-                # This will only work if Pillow is installed
-                from PIL import Image, ImageDraw
-                img = Image.new('RGB', (400, 300), color='lightblue')
-                d = ImageDraw.Draw(img)
-                d.text((100, 150), "Package\nSample\nImage", fill="darkblue", align="center")
-                img.save(sample_image_path)
-                print(f"📸 Created sample image at: {sample_image_path}")
-            except ImportError:
-                # Pillow not installed, create a text file instead
-                with open(sample_image_path.replace('.jpg', '.txt'), 'w') as f:
-                    f.write("Sample package image - upload real images via admin panel")
-                print(f"📝 Created placeholder text file (install Pillow for image support)")
-            except Exception as e:
-                print(f"⚠️ Could not create sample image: {e}")
-        
-        save_data(default_data)
-        return default_data
+    }
+
+    # Create a sample image file if it doesn't exist
+    sample_image_path = os.path.join(UPLOAD_FOLDER, 'sample_package.jpg')
+    if not os.path.exists(sample_image_path):
+        try:
+            # Try to create a simple placeholder image
+            # This will only work if Pillow is installed
+            from PIL import Image, ImageDraw
+            img = Image.new('RGB', (400, 300), color='lightblue')
+            d = ImageDraw.Draw(img)
+            d.text((100, 150), "Package\nSample\nImage", fill="darkblue", align="center")
+            img.save(sample_image_path)
+            print(f"📸 Created sample image at: {sample_image_path}")
+        except ImportError:
+            # Pillow not installed, create a text file instead
+            with open(sample_image_path.replace('.jpg', '.txt'), 'w') as f:
+                f.write("Sample package image - upload real images via admin panel")
+            print(f"📝 Created placeholder text file (install Pillow for image support)")
+        except Exception as e:
+            print(f"⚠️ Could not create sample image: {e}")
     
-    try:
-        with open(DATA_FILE, 'r') as f:
-            data = json.load(f)
-            
-            # Ensure system_stats exists in old data
-            if 'system_stats' not in data:
-                data['system_stats'] = {
-                    'total_tracking_ids': len(data.get('tracking_ids', {})),
-                    'active_shipments': sum(1 for t in data.get('tracking_ids', {}).values() 
-                                           if t.get('status', '') in ['In Transit', 'Processing', 'Out for Delivery']),
-                    'delivered_today': sum(1 for t in data.get('tracking_ids', {}).values() 
-                                          if t.get('status', '') == 'Delivered' and 
-                                          t.get('last_updated', '').startswith(str(datetime.now().date()))),
-                    'images_count': sum(1 for t in data.get('tracking_ids', {}).values() 
-                                       if t.get('image_url') or t.get('image_base64') or t.get('has_image')),
-                    'last_updated': str(datetime.now())
-                }
-                save_data(data)
-                print("📊 Added system stats to existing data")
-                
-            # Update last_updated timestamp
-            data['system_stats']['last_updated'] = str(datetime.now())
-            
-            return data
-    except Exception as e:
-        print(f"❌ Error loading data, creating new: {e}")
-        return load_data()  # Recursive call to create new data
+    return default_data
 
-def save_data(data):
-    """Save tracking data with error handling"""
-    try:
-        # Update stats before saving
-        tracking_ids = data.get('tracking_ids', {})
-        
-        stats = data.get('system_stats', {})
-        stats['total_tracking_ids'] = len(tracking_ids)
-        stats['active_shipments'] = sum(
-            1 for t in tracking_ids.values() 
-            if t.get('status', '') in ['In Transit', 'Processing', 'Out for Delivery']
-        )
-        stats['delivered_today'] = sum(
-            1 for t in tracking_ids.values() 
-            if t.get('status', '') == 'Delivered' and 
-            t.get('last_updated', '').startswith(str(datetime.now().date()))
-        )
-        stats['images_count'] = sum(
-            1 for t in tracking_ids.values() 
-            if t.get('image_url') or t.get('image_base64')
-        )
-        stats['last_updated'] = str(datetime.now())
-        
-        data['system_stats'] = stats
-        
-        with open(DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
-        
-        # Print debug info in development
-        if not IS_PRODUCTION:
-            print(f"💾 Saved data: {len(tracking_ids)} tracking IDs")
-        
-        return True
-    except Exception as e:
-        print(f"❌ Error saving data: {e}")
-        return False
+# Append-only location trail of every shipment, stored apart from the shipment records
+location_history = LocationHistory(HISTORY_DB_FILE, full_resolution=HISTORY_FULL_RESOLUTION,
+                                   tolerance=HISTORY_TOLERANCE_METERS, max_points=HISTORY_MAX_POINTS)
+
+# In-memory shipment store; loads the stored data once and watches it for changes
+store = ShipmentStore(create_backend(STORAGE_BACKEND, DATA_FILE, DB_FILE, JOURNAL_COMPACT_EVERY),
+                      create_default_data, refresh_interval=STORE_REFRESH_INTERVAL,
+                      history=location_history, record_locations=RECORD_LOCATIONS)
+
+# Pushes shipment changes to open tracking pages
+live_updates = LiveUpdates(store, poll_interval=STORE_REFRESH_INTERVAL, max_streams=MAX_STREAMS)
+
+# Secondary indexes behind the paginated /api/tracking/all listing
+shipment_index = ShipmentIndex()
+store.add_listener(shipment_index.on_change)
+# Prefix search over recipients, addresses and tracking IDs
+search_index = SearchIndex()
+store.add_listener(search_index.on_change)
+# Grid over each shipment's current position for bounding-box and radius queries
+geo_index = GeoIndex(cell_size=GEO_CELL_DEGREES, cached_zooms=CLUSTER_CACHED_ZOOMS)
+store.add_listener(geo_index.on_change)
+
+# Buffers GPS pings and writes them to the store in coalesced batches
+ping_buffer = PingBuffer(store, flush_interval=PING_FLUSH_INTERVAL, max_pending=PING_FLUSH_THRESHOLD)
+
+# Which shipments reference each uploaded image, so shared files are deleted only when unused
+image_index = ImageIndex()
+store.add_listener(image_index.on_change)
+# Content-addressed uploads with resized variants
+image_store = ImageStore(UPLOAD_FOLDER, workers=IMAGE_WORKERS)
+
+# Long-running admin operations, with progress any worker can report
+jobs = JobTracker(JOBS_DIR, retention=JOB_RETENTION)
+
+def tracking_etag(tracking_id, tracking_data):
+    """Per-shipment ETag derived from the record's last_updated and location version"""
+    token = f"{tracking_id}|{tracking_data.get('last_updated', '')}|{tracking_data.get('location_seq', 0)}"
+    return hashlib.sha1(token.encode()).hexdigest()[:20]
+
+def cacheable_json(payload, max_age=0, last_modified=None):
+    """JSON response with a content-derived ETag; answers If-None-Match/If-Modified-Since with 304"""
+    response = jsonify(payload)
+    response.add_etag()
+    if last_modified:
+        response.last_modified = last_modified
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 # Serve static files
 @app.route('/static/<path:filename>')
@@ -284,12 +355,50 @@ def static_files(filename):
     return send_from_directory('static', filename)
 
 # Serve uploaded files
-@app.route('/uploads/<filename>')
+_missing_uploads = {}
+
+@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    try:
-        return send_from_directory(UPLOAD_FOLDER, filename)
-    except:
+    """Serve an uploaded image from either layout, with Range and conditional request support"""
+    now = time.monotonic()
+    if _missing_uploads.get(filename, 0) > now:
         return jsonify({'error': 'File not found'}), 404
+    
+    # A variant that is still being made is waited for; without one the original is served
+    resolved = image_store.resolve(filename)
+    if resolved is None:
+        if len(_missing_uploads) >= MISSING_UPLOADS_MAX:
+            _missing_uploads.clear()
+        _missing_uploads[filename] = now + MISSING_UPLOAD_TTL
+        return jsonify({'error': 'File not found'}), 404
+    
+    name = resolved.rsplit('/', 1)[-1]
+    if name == filename.rsplit('/', 1)[-1] and image_store.is_content_addressed(name):
+        # The name is derived from the content, so the bytes behind it never change
+        etag = os.path.splitext(name)[0]
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        etag = True
+        cache_control = f'public, max-age={UPLOAD_MAX_AGE}'
+    
+    if UPLOADS_SENDFILE == 'x-accel-redirect':
+        response = Response(mimetype=mimetypes.guess_type(resolved)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = UPLOADS_ACCEL_PREFIX + resolved
+        if etag is not True:
+            response.set_etag(etag)
+    else:
+        try:
+            response = send_from_directory(UPLOAD_FOLDER, resolved, etag=etag)
+        except NotFound:
+            return jsonify({'error': 'File not found'}), 404
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def forget_missing_uploads(filenames):
+    """Drop cached 404s for files that exist now, under either layout's path"""
+    for filename in filenames:
+        _missing_uploads.pop(filename, None)
+        _missing_uploads.pop(image_store.shard_path(filename), None)
 
 # Routes
 @app.route('/')
@@ -320,25 +429,32 @@ def admin_location_page():
                          default_location=config.get('default_location'))
 
 # Health check endpoint for Render.com and other platforms
+_health_cache = {'payload': None, 'expires': 0}
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
-    return jsonify({
-        'status': 'healthy', 
-        'timestamp': str(datetime.now()),
-        'version': '2.0.0',
-        'data_file': os.path.exists(DATA_FILE),
-        'config_file': os.path.exists(CONFIG_FILE),
-        'uploads_folder': os.path.exists(UPLOAD_FOLDER),
-        'tracking_ids_count': len(load_data().get('tracking_ids', {}))
-    })
+    # Probes call this constantly; reuse the last answer for a few seconds
+    now = time.monotonic()
+    if _health_cache['payload'] is None or now >= _health_cache['expires']:
+        _health_cache['payload'] = {
+            'status': 'healthy', 
+            'timestamp': str(datetime.now()),
+            'version': '2.0.0',
+            'data_file': os.path.exists(DATA_FILE),
+            'config_file': os.path.exists(CONFIG_FILE),
+            'uploads_folder': os.path.exists(UPLOAD_FOLDER),
+            'tracking_ids_count': store.count()
+        }
+        _health_cache['expires'] = now + HEALTH_CACHE_TTL
+    return cacheable_json(_health_cache['payload'], max_age=HEALTH_CACHE_TTL)
 
 # System status endpoint
 @app.route('/api/status', methods=['GET'])
 def system_status():
     """System status information"""
     config = load_config()
-    data = load_data()
+    stats = store.stats()
     
     return jsonify({
         'system': {
@@ -349,10 +465,10 @@ def system_status():
             'uptime': str(datetime.now() - datetime.fromtimestamp(os.path.getctime(DATA_FILE)) if os.path.exists(DATA_FILE) else datetime.now())
         },
         'data': {
-            'total_tracking_ids': len(data.get('tracking_ids', {})),
-            'active_shipments': data.get('system_stats', {}).get('active_shipments', 0),
-            'images_uploaded': data.get('system_stats', {}).get('images_count', 0),
-            'last_updated': data.get('system_stats', {}).get('last_updated', str(datetime.now()))
+            'total_tracking_ids': store.count(),
+            'active_shipments': stats.get('active_shipments', 0),
+            'images_uploaded': stats.get('images_count', 0),
+            'last_updated': stats.get('last_updated', str(datetime.now()))
         },
         'features': config.get('features', {})
     })
@@ -375,53 +491,137 @@ def update_location():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
     location_data = request.json
+    location, error = parse_location(location_data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    
+    config = save_config(lambda config: config.update(default_location=location))
+    if config is None:
+        return jsonify({'success': False, 'error': 'Could not save configuration'}), 500
     
+    # Optionally move all existing tracking IDs to this location, in the background
+    job = None
+    if location_data.get('update_existing', False):
+        store.sync()
+        job = start_relocation(shipment_index.matching({}), location, {})
+    
+    return jsonify({
+        'success': True, 
+        'message': 'Default location updated successfully',
+        'location': config['default_location'],
+        'updated_tracking_ids': location_data.get('update_existing', False),
+        'job': job
+    })
+
+def parse_location(location_data):
+    """Validate a {city, lat, long} location; returns (location, error message)"""
     # Validate required fields
     required_fields = ['city', 'lat', 'long']
-    if not all(field in location_data for field in required_fields):
-        return jsonify({'success': False, 'error': 'Missing required fields: city, lat, long'}), 400
+    if not isinstance(location_data, dict) or not all(field in location_data for field in required_fields):
+        return None, 'Missing required fields: city, lat, long'
     
     # Validate coordinates
     try:
         lat = float(location_data['lat'])
         long = float(location_data['long'])
+    except (TypeError, ValueError):
+        return None, 'Invalid coordinates. Must be numbers'
+    if not (-90 <= lat <= 90):
+        return None, 'Latitude must be between -90 and 90'
+    if not (-180 <= long <= 180):
+        return None, 'Longitude must be between -180 and 180'
+    
+    return {'city': location_data['city'], 'lat': lat, 'long': long}, None
+
+def select_shipments(filters):
+    """Tracking IDs matching relocation filters; returns (ids, error message).
+    
+    status, city, state and delivery_from/delivery_to work as in the
+    /api/tracking/all listing; within is a [south, west, north, east] box
+    around the shipments' current positions.
+    """
+    unknown = set(filters) - set(RELOCATE_FILTERS)
+    if unknown:
+        return None, f"Unknown filters: {', '.join(sorted(unknown))}"
+    store.sync()
+    tracking_ids = shipment_index.matching(filters)
+    box = filters.get('within')
+    if box is not None:
+        try:
+            south, west, north, east = (float(value) for value in box)
+        except (TypeError, ValueError):
+            return None, 'within must be [south, west, north, east]'
+        if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180) or not (-180 <= east <= 180):
+            return None, 'within must have -90 <= south <= north <= 90 and longitudes within -180..180'
+        tracking_ids &= {found[0] for found in geo_index.within(south, west, north, east)}
+    return tracking_ids, None
+
+def start_relocation(tracking_ids, location, filters):
+    """Move the latest location of the given shipments to location in a background job.
+    
+    Shipments are changed and saved in chunks of BULK_CHUNK_SIZE, so other
+    writers in every worker get the store between chunks rather than waiting
+    for the whole fleet. Each chunk is saved all at once or not at all.
+    """
+    tracking_ids = sorted(tracking_ids)
+    
+    def relocate(job):
+        job.progress(done=0, total=len(tracking_ids), phase='relocating')
+        now = str(datetime.now())
+        updated = 0
         
-        if not (-90 <= lat <= 90):
-            return jsonify({'success': False, 'error': 'Latitude must be between -90 and 90'}), 400
-        if not (-180 <= long <= 180):
-            return jsonify({'success': False, 'error': 'Longitude must be between -180 and 180'}), 400
-            
-    except ValueError:
-        return jsonify({'success': False, 'error': 'Invalid coordinates. Must be numbers'}), 400
-    
-    config = load_config()
-    config['default_location'] = {
-        'city': location_data['city'],
-        'lat': lat,
-        'long': long
-    }
-    
-    # Optionally update all existing tracking IDs to this location
-    if location_data.get('update_existing', False):
-        data = load_data()
-        updated_count = 0
-        for tracking_id in data['tracking_ids']:
-            if data['tracking_ids'][tracking_id].get('locations'):
-                data['tracking_ids'][tracking_id]['locations'][0] = config['default_location']
-                updated_count += 1
+        def merge(tracking_id, current, _):
+            if current is None or not current.get('locations'):
+                return None  # deleted since the job started, or never located
+            current['locations'][0] = dict(location)
+            current['last_updated'] = now
+            return current
         
-        if updated_count > 0:
-            save_data(data)
-            print(f"📍 Updated location for {updated_count} tracking IDs")
-    
-    save_config(config)
+        for start in range(0, len(tracking_ids), BULK_CHUNK_SIZE):
+            chunk = tracking_ids[start:start + BULK_CHUNK_SIZE]
+            stored = store.merge_many([(tid, None) for tid in chunk], merge)
+            if stored is None:
+                raise RuntimeError(f'Could not save the relocated shipments after updating {updated}')
+            updated += sum(1 for record in stored if record is not None)
+            job.progress(done=start + len(chunk))
+        print(f"📍 Updated location for {updated} tracking IDs")
+        return {'matched': len(tracking_ids), 'updated': updated}
+    
+    return jobs.start('relocate', relocate, params={'location': location, 'filters': filters})
+
+@app.route('/api/tracking/relocate', methods=['POST'])
+def relocate_tracking():
+    """Move the current location of every shipment matching filters, as a background job.
+    
+    Body: {"city", "lat", "long", "filters": {...}} with the filters of
+    select_shipments(); no filters means every shipment. Answers 202 with the
+    job, whose progress is at /api/jobs/<job_id>.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or 'admin_token' not in auth_header:
+        if not request.json.get('admin_token') == 'admin_token':
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    return jsonify({
-        'success': True, 
-        'message': 'Default location updated successfully',
-        'location': config['default_location'],
-        'updated_tracking_ids': location_data.get('update_existing', False)
-    })
+    location, error = parse_location(request.json)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    filters = request.json.get('filters') or {}
+    if not isinstance(filters, dict):
+        return jsonify({'success': False, 'error': 'filters must be an object'}), 400
+    tracking_ids, error = select_shipments(filters)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    
+    job = start_relocation(tracking_ids, location, filters)
+    return jsonify({'success': True, 'job': job, 'status_url': f"/api/jobs/{job['job_id']}"}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Progress and result of a background job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
 
 @app.route('/api/config', methods=['PUT'])
 def update_config():
@@ -433,15 +633,18 @@ def update_config():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
     config_data = request.json
-    config = load_config()
     
     # Update only allowed fields
     allowed_fields = ['default_location', 'company_name', 'map_zoom_level', 'features']
-    for field in allowed_fields:
-        if field in config_data:
-            config[field] = config_data[field]
     
-    save_config(config)
+    def apply(config):
+        for field in allowed_fields:
+            if field in config_data:
+                config[field] = config_data[field]
+    
+    config = save_config(apply)
+    if config is None:
+        return jsonify({'success': False, 'error': 'Could not save configuration'}), 500
     
     return jsonify({
         'success': True, 
@@ -453,10 +656,9 @@ def update_config():
 @app.route('/api/tracking/<tracking_id>', methods=['GET'])
 def get_tracking_info(tracking_id):
     """Get tracking information by ID"""
-    data = load_data()
+    tracking_data = store.get(tracking_id)
     
-    if tracking_id in data['tracking_ids']:
-        tracking_data = data['tracking_ids'][tracking_id]
+    if tracking_data is not None:
         return jsonify({
             'success': True,
             **tracking_data
@@ -467,151 +669,430 @@ def get_tracking_info(tracking_id):
 @app.route('/api/tracking/<tracking_id>/status', methods=['GET'])
 def get_tracking_status(tracking_id):
     """Get real-time tracking status with simulated movement"""
-    data = load_data()
+    tracking_data = store.get(tracking_id)
     
-    if tracking_id in data['tracking_ids']:
-        tracking_data = data['tracking_ids'][tracking_id]
+    if tracking_data is not None:
         
         # Simulate real-time movement for packages in transit (only in development for testing)
         if not IS_PRODUCTION and tracking_data['status'] in ['In Transit', 'Processing', 'Out for Delivery']:
-            # Add small random movement to location
-            if tracking_data['locations']:
-                current_location = tracking_data['locations'][0]
-                new_lat = current_location['lat'] + random.uniform(-0.01, 0.01)
-                new_long = current_location['long'] + random.uniform(-0.01, 0.01)
-                
-                # Keep within reasonable bounds
-                new_lat = max(-90, min(90, new_lat))
-                new_long = max(-180, min(180, new_long))
-                
-                tracking_data['locations'][0]['lat'] = round(new_lat, 4)
-                tracking_data['locations'][0]['long'] = round(new_long, 4)
-                tracking_data['last_updated'] = str(datetime.now())
-            
-            # Occasionally update status (only in development)
-            if random.random() < 0.1:  # 10% chance to change status in development
-                status_options = {
-                    'Processing': 'In Transit',
-                    'In Transit': 'Out for Delivery',
-                    'Out for Delivery': 'Delivered'
-                }
-                if tracking_data['status'] in status_options:
-                    tracking_data['status'] = status_options[tracking_data['status']]
-                    print(f"🔄 Updated {tracking_id} status to: {tracking_data['status']}")
-            
-            # Save updated data
-            data['tracking_ids'][tracking_id] = tracking_data
-            save_data(data)
+            tracking_data = store.update(tracking_id, simulate_movement) or tracking_data
         
-        return jsonify({
-            'success': True,
-            **tracking_data
-        })
+        # Idle parcels answer repeat polls with 304 before any JSON is encoded
+        etag = tracking_etag(tracking_id, tracking_data)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            delta = status_delta(tracking_data, request.args.get('since', type=int))
+            response = jsonify(delta or {'success': True, **tracking_data})
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
     
     return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
 
+def status_delta(tracking_data, since):
+    """Status with only the location points recorded after version `since`.
+    
+    location_seqs lists the version of every point the record holds now, so
+    clients drop points that were replaced or trimmed since they last asked.
+    Returns None when a full response is needed: no since= given, a record
+    written before location versions existed, or a version from the future.
+    """
+    current = tracking_data.get('location_seq')
+    if since is None or current is None or since > current:
+        return None
+    locations = tracking_data.get('locations') or []
+    return {
+        'success': True,
+        'delta': True,
+        'status': tracking_data.get('status'),
+        'delivery_date': tracking_data.get('delivery_date'),
+        'last_updated': tracking_data.get('last_updated'),
+        'location_seq': current,
+        # How many points the record keeps (0: all), so clients can trim what they merge
+        'max_locations': RECORD_LOCATIONS,
+        'location_seqs': [point.get('seq') for point in locations],
+        'locations': [point for point in locations if point.get('seq', 0) > since]
+    }
+
+def geo_args(names):
+    """Read required float query parameters; returns (values, error message)"""
+    values = []
+    for name in names:
+        value = request.args.get(name, type=float)
+        if value is None:
+            return None, f"Query parameters {', '.join(names)} are required numbers"
+        values.append(value)
+    return values, None
+
+def geo_limit():
+    limit = request.args.get('limit', DEFAULT_GEO_RESULTS, type=int)
+    if not limit or not (1 <= limit <= MAX_GEO_RESULTS):
+        return None
+    return limit
+
+@app.route('/api/tracking/within', methods=['GET'])
+def tracking_within():
+    """Shipments whose current position is inside a bounding box (map viewport)"""
+    values, error = geo_args(['south', 'west', 'north', 'east'])
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    south, west, north, east = values
+    if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180) or not (-180 <= east <= 180):
+        return jsonify({'success': False, 'error': 'Box must have -90 <= south <= north <= 90 and longitudes within -180..180'}), 400
+    limit = geo_limit()
+    if limit is None:
+        return jsonify({'success': False, 'error': f'limit must be between 1 and {MAX_GEO_RESULTS}'}), 400
+    
+    store.sync()
+    found = geo_index.within(south, west, north, east, limit=limit + 1)
+    items = [{'tracking_id': tid, 'lat': lat, 'long': long, 'city': city} for tid, lat, long, city in found[:limit]]
+    return jsonify({'success': True, 'items': items, 'count': len(items), 'truncated': len(found) > limit})
+
+@app.route('/api/tracking/clusters', methods=['GET'])
+def tracking_clusters():
+    """Shipment markers for a map viewport, aggregated into clusters at the map's zoom level.
+    
+    Each cluster gives the centroid and count of the shipments in one grid
+    cell about 64 pixels wide; a cluster of one also names its tracking ID.
+    """
+    values, error = geo_args(['south', 'west', 'north', 'east'])
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    south, west, north, east = values
+    if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180) or not (-180 <= east <= 180):
+        return jsonify({'success': False, 'error': 'Box must have -90 <= south <= north <= 90 and longitudes within -180..180'}), 400
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None or not (0 <= zoom <= MAX_CLUSTER_ZOOM):
+        return jsonify({'success': False, 'error': f'zoom must be an integer between 0 and {MAX_CLUSTER_ZOOM}'}), 400
+    limit = geo_limit()
+    if limit is None:
+        return jsonify({'success': False, 'error': f'limit must be between 1 and {MAX_GEO_RESULTS}'}), 400
+    
+    store.sync()
+    found = geo_index.clusters(zoom, south, west, north, east)
+    clusters = []
+    for lat, long, count, tracking_id in found[:limit]:
+        cluster = {'lat': round(lat, 6), 'long': round(long, 6), 'count': count}
+        if tracking_id is not None:
+            cluster['tracking_id'] = tracking_id
+        clusters.append(cluster)
+    return jsonify({
+        'success': True,
+        'zoom': zoom,
+        'clusters': clusters,
+        'shipments': sum(cluster['count'] for cluster in clusters),
+        'truncated': len(found) > limit
+    })
+
+@app.route('/api/tracking/nearby', methods=['GET'])
+def tracking_nearby():
+    """Shipments whose current position is within radius_km of a point, nearest first"""
+    values, error = geo_args(['lat', 'long', 'radius_km'])
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    lat, long, radius_km = values
+    if not (-90 <= lat <= 90) or not (-180 <= long <= 180):
+        return jsonify({'success': False, 'error': 'Latitude must be between -90 and 90 and longitude between -180 and 180'}), 400
+    if not radius_km > 0:
+        return jsonify({'success': False, 'error': 'radius_km must be positive'}), 400
+    limit = geo_limit()
+    if limit is None:
+        return jsonify({'success': False, 'error': f'limit must be between 1 and {MAX_GEO_RESULTS}'}), 400
+    
+    store.sync()
+    found = geo_index.nearby(lat, long, radius_km, limit=limit + 1)
+    items = [{'tracking_id': tid, 'lat': p_lat, 'long': p_long, 'city': city, 'distance_km': round(distance, 3)}
+             for tid, p_lat, p_long, city, distance in found[:limit]]
+    return jsonify({'success': True, 'items': items, 'count': len(items), 'truncated': len(found) > limit})
+
+@app.route('/api/tracking/pings', methods=['POST'])
+def ingest_pings():
+    """Accept a batch of GPS pings (tracking_id, lat, long, timestamp) for buffered writing.
+    
+    The body is {"pings": [...]}, a JSON array, or NDJSON with one ping per
+    line. Valid pings are buffered and written within PING_FLUSH_INTERVAL
+    seconds; flush=1 writes them before answering.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        pings = [(result.get('error'), ping)
+                 for result, ping in ndjson_items(io.BufferedReader(request.stream, 64 * 1024))]
+    else:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            body = body.get('pings')
+        if not isinstance(body, list):
+            return jsonify({'success': False, 'error': 'Expected {"pings": [...]}, a JSON array or NDJSON'}), 400
+        pings = [(None, ping) for ping in body]
+    
+    accepted = []
+    errors = []
+    for index, (error, ping) in enumerate(pings):
+        try:
+            if error:
+                raise ValueError(error)
+            tracking_id, point = parse_ping(ping)
+            if tracking_id not in store:
+                raise ValueError('Tracking ID not found')
+            accepted.append((tracking_id, point))
+        except ValueError as e:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'index': index, 'error': str(e)})
+    
+    pending = ping_buffer.add(accepted)
+    if request.args.get('flush') == '1':
+        ping_buffer.flush()
+        pending = ping_buffer.pending()
+    
+    return jsonify({
+        'success': True,
+        'accepted': len(accepted),
+        'rejected': len(pings) - len(accepted),
+        'errors': errors,
+        'pending': pending
+    }), 202
+
+@app.route('/api/tracking/<tracking_id>/history', methods=['GET'])
+def get_tracking_history(tracking_id):
+    """Recorded location trail, oldest first; older stretches are downsampled.
+    
+    since=<seq> returns only points recorded after that location version,
+    limit=<n> only the newest n points.
+    """
+    if tracking_id not in store:
+        return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
+    
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({'success': False, 'error': 'limit must be positive'}), 400
+    
+    points = location_history.trail(tracking_id, since=since, limit=limit)
+    return cacheable_json({'success': True, 'tracking_id': tracking_id, 'points': points})
+
+@app.route('/api/tracking/<tracking_id>/stream', methods=['GET'])
+def stream_tracking_status(tracking_id):
+    """Stream location and status changes as Server-Sent Events"""
+    tracking_data = store.get(tracking_id)
+    
+    if tracking_data is None:
+        return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
+    
+    if IS_PRODUCTION:
+        tick, on_tick = STREAM_KEEPALIVE, None
+    else:
+        # Keep the development movement simulation going at the old polling cadence
+        tick, on_tick = 4, lambda: store.update(tracking_id, simulate_movement)
+    
+    events = live_updates.stream(tracking_id, tracking_data, tick=tick,
+                                 max_duration=STREAM_MAX_DURATION, on_tick=on_tick)
+    if events is None:
+        # Every stream slot is taken; the tracking page falls back to polling
+        response = jsonify({'success': False, 'error': 'Too many live streams, poll /status instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(STREAM_MAX_DURATION)
+        return response
+    response = app.response_class(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def simulate_movement(tracking_data):
+    """Nudge a shipment's position and occasionally advance its status (development only)"""
+    if tracking_data['status'] not in ['In Transit', 'Processing', 'Out for Delivery']:
+        return
+    
+    # Record a new point a small random step away from the current location
+    if tracking_data['locations']:
+        current_location = tracking_data['locations'][0]
+        new_lat = current_location['lat'] + random.uniform(-0.01, 0.01)
+        new_long = current_location['long'] + random.uniform(-0.01, 0.01)
+        
+        # Keep within reasonable bounds
+        new_lat = max(-90, min(90, new_lat))
+        new_long = max(-180, min(180, new_long))
+        
+        tracking_data['locations'].insert(0, {
+            'city': current_location.get('city', ''),
+            'lat': round(new_lat, 4),
+            'long': round(new_long, 4)
+        })
+        tracking_data['last_updated'] = str(datetime.now())
+    
+    # Occasionally update status (only in development)
+    if random.random() < 0.1:  # 10% chance to change status in development
+        status_options = {
+            'Processing': 'In Transit',
+            'In Transit': 'Out for Delivery',
+            'Out for Delivery': 'Delivered'
+        }
+        if tracking_data['status'] in status_options:
+            tracking_data['status'] = status_options[tracking_data['status']]
+            tracking_data['last_updated'] = str(datetime.now())
+            print(f"🔄 Updated status to: {tracking_data['status']}")
+
 # Image upload endpoint
 @app.route('/api/tracking/<tracking_id>/image', methods=['POST'])
 def upload_tracking_image(tracking_id):
     """Upload image for tracking ID"""
-    data = load_data()
-    
-    if tracking_id not in data['tracking_ids']:
+    if tracking_id not in store:
         return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
     
-    # Check if image file is in the request
-    if 'image' not in request.files:
-        # Check if base64 image data is in JSON
-        if request.json and 'image_base64' in request.json:
-            try:
-                # Decode base64 image
-                image_data = request.json['image_base64']
-                if ',' in image_data:
-                    # Remove data:image/...;base64, prefix
-                    image_data = image_data.split(',')[1]
-                
-                # Convert base64 to bytes
-                image_bytes = base64.b64decode(image_data)
-                
-                # Save image file
-                filename = f"{tracking_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                
-                with open(filepath, 'wb') as f:
-                    f.write(image_bytes)
-                
-                # Update tracking data
-                data['tracking_ids'][tracking_id]['image_url'] = f'/uploads/{filename}'
-                data['tracking_ids'][tracking_id]['last_updated'] = str(datetime.now())
-                
-                # Update stats
-                save_data(data)
-                
-                return jsonify({
-                    'success': True, 
-                    'message': 'Image uploaded successfully',
-                    'image_url': f'/uploads/{filename}',
-                    'tracking_id': tracking_id
-                })
-                
-            except Exception as e:
-                return jsonify({'success': False, 'error': f'Invalid image data: {str(e)}'}), 400
-        
+    # Refuse oversized uploads before reading them; base64 text is a third larger than the image
+    if request.content_length and request.content_length > IMAGE_MAX_BYTES * 4 // 3 + 64 * 1024:
+        return jsonify({'success': False, 'error': f'Image larger than {IMAGE_MAX_BYTES} bytes'}), 413
+    
+    if request.mimetype == 'application/json':
+        # Base64 image data in JSON, decoded while the body streams in
+        image_stream = Base64Reader(iter_string_field(request.stream, 'image_base64'))
+    elif 'image' in request.files:
+        # Handle file upload
+        file = request.files['image']
+        if file.filename == '':
+            return jsonify({'success': False, 'error': 'No image selected'}), 400
+        if not allowed_file(file.filename):
+            return jsonify({'success': False, 'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}), 400
+        image_stream = file.stream
+    else:
         return jsonify({'success': False, 'error': 'No image provided'}), 400
     
-    # Handle file upload
-    file = request.files['image']
+    # The stored name comes from the content, and the format from the bytes rather than the file name
+    try:
+        filename = image_store.save(image_stream, max_size=IMAGE_MAX_BYTES)
+    except ImageTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid image data: {str(e)}'}), 400
     
-    if file.filename == '':
-        return jsonify({'success': False, 'error': 'No image selected'}), 400
+    forget_missing_uploads([filename, *image_store.variant_names(filename).values()])
     
-    if file and allowed_file(file.filename):
-        # Save the file
-        filename = secure_filename(f"{tracking_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}")
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # Update tracking data
-        data['tracking_ids'][tracking_id]['image_url'] = f'/uploads/{filename}'
-        data['tracking_ids'][tracking_id]['last_updated'] = str(datetime.now())
-        
-        # Save data
-        save_data(data)
-        
-        return jsonify({
-            'success': True, 
-            'message': 'Image uploaded successfully',
-            'image_url': f'/uploads/{filename}',
-            'tracking_id': tracking_id
-        })
+    # Update tracking data
+    record = set_tracking_image(tracking_id, filename)
+    if record is None:
+        return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
+    
+    return jsonify({
+        'success': True, 
+        'message': 'Image uploaded successfully',
+        'image_url': record['image_url'],
+        'image_variants': record['image_variants'],
+        'tracking_id': tracking_id
+    })
+
+def set_tracking_image(tracking_id, filename):
+    """Point a shipment at a newly uploaded image and its resized variants"""
+    def apply(record):
+        record['image_url'] = f'/uploads/{image_store.shard_path(filename)}'
+        record['image_variants'] = {variant: f'/uploads/{image_store.shard_path(name)}'
+                                    for variant, name in image_store.variant_names(filename).items()}
+        record['last_updated'] = str(datetime.now())
+    return store.update(tracking_id, apply)
+
+def release_image(image_url):
+    """Delete an uploaded image file once no shipment references it, under either layout's URL"""
+    if not image_url or not image_url.startswith('/uploads/'):
+        return
+    filename = image_url.split('/')[-1]
+    if image_index.is_referenced(f'/uploads/{filename}') or \
+            image_index.is_referenced(f'/uploads/{image_store.shard_path(filename)}'):
+        return
+    try:
+        if image_store.is_blob(filename):
+            if image_store.remove(filename):
+                print(f"🗑️ Deleted image file: {filename}")
+        else:
+            path = image_store.locate(filename)
+            if path is not None:
+                os.remove(os.path.join(UPLOAD_FOLDER, path))
+                print(f"🗑️ Deleted image file: {filename}")
+    except Exception as e:
+        print(f"⚠️ Could not delete image file: {e}")
+
+def referenced_uploads():
+    """Names of the upload files some shipment points at, plus the sample image or its placeholder"""
+    names = {url.split('/')[-1] for url in image_index.urls() if url.startswith('/uploads/')}
+    names.update(['sample_package.jpg', 'sample_package.txt'])
+    return names
+
+def start_uploads_gc():
+    """Delete upload files no shipment references, in a background job.
+    
+    The uploads folder is swept in batches of UPLOADS_GC_BATCH files. Each
+    batch is checked against the references and deleted under the store's
+    write lock, so an image attached meanwhile is never lost, and writers
+    get their turn between batches.
+    """
+    def collect(job):
+        job.progress(done=0, phase='sweeping')
+        counts = image_store.sweep(referenced_uploads, store.locked, batch_size=UPLOADS_GC_BATCH,
+                                   min_age=UPLOADS_GC_MIN_AGE,
+                                   progress=lambda counts: job.progress(done=counts['scanned']))
+        print(f"🧹 Deleted {counts['deleted']} orphaned upload files, "
+              f"{counts['reclaimed_bytes'] / 1048576:.1f} MB reclaimed")
+        return counts
+    
+    return jobs.start('uploads-gc', collect)
+
+_uploads_gc = {'pid': None, 'lock': threading.Lock()}
+
+def run_uploads_gc_schedule():
+    """Start an orphaned upload sweep every UPLOADS_GC_INTERVAL seconds, from one worker at a time"""
+    stamp = UPLOADS_GC_STAMP
+    lock = FileLock(stamp + '.lock')
+    while True:
+        with lock:
+            try:
+                due = time.time() - os.path.getmtime(stamp) >= UPLOADS_GC_INTERVAL
+            except FileNotFoundError:
+                # First start on this data directory: the first sweep is one interval away
+                with open(stamp, 'w') as f:
+                    f.write(str(datetime.now()))
+                due = False
+            if due:
+                # Claim this round before starting, so other workers skip it
+                with open(stamp, 'w') as f:
+                    f.write(str(datetime.now()))
+        if due:
+            start_uploads_gc()
+        time.sleep(min(UPLOADS_GC_INTERVAL, 3600))
+
+@app.before_request
+def start_uploads_gc_schedule():
+    """Start each worker's sweep scheduler on its first request"""
+    if not UPLOADS_GC_INTERVAL or _uploads_gc['pid'] == os.getpid():
+        return
+    with _uploads_gc['lock']:
+        if _uploads_gc['pid'] != os.getpid():
+            _uploads_gc['pid'] = os.getpid()
+            threading.Thread(target=run_uploads_gc_schedule, name='uploads-gc', daemon=True).start()
+
+@app.route('/api/uploads/gc', methods=['POST'])
+def collect_uploads():
+    """Delete orphaned upload files as a background job; answers 202 with the job"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or 'admin_token' not in auth_header:
+        if not (request.get_json(silent=True) or {}).get('admin_token') == 'admin_token':
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    return jsonify({'success': False, 'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}), 400
+    job = start_uploads_gc()
+    return jsonify({'success': True, 'job': job, 'status_url': f"/api/jobs/{job['job_id']}"}), 202
 
-# Delete image endpoint
 @app.route('/api/tracking/<tracking_id>/image', methods=['DELETE'])
 def delete_tracking_image(tracking_id):
     """Delete image for tracking ID"""
-    data = load_data()
+    removed = {}
     
-    if tracking_id not in data['tracking_ids']:
+    def remove_image(record):
+        if 'image_url' in record:
+            removed['image_url'] = record.pop('image_url')
+            record.pop('image_variants', None)
+            record['last_updated'] = str(datetime.now())
+    
+    if store.update(tracking_id, remove_image) is None:
         return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
     
-    # Remove image reference
-    if 'image_url' in data['tracking_ids'][tracking_id]:
-        image_url = data['tracking_ids'][tracking_id].pop('image_url')
-        
-        # Try to delete the actual file
-        try:
-            filename = image_url.split('/')[-1]
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                print(f"🗑️ Deleted image file: {filename}")
-        except Exception as e:
-            print(f"⚠️ Could not delete image file: {e}")
-        
-        data['tracking_ids'][tracking_id]['last_updated'] = str(datetime.now())
-        save_data(data)
+    # Delete the file too, unless another shipment shares it
+    release_image(removed.get('image_url'))
     
     return jsonify({'success': True, 'message': 'Image deleted successfully'})
 
@@ -632,28 +1113,62 @@ def admin_login():
 
 @app.route('/api/tracking/all', methods=['GET'])
 def get_all_tracking():
-    """Get all tracking data"""
-    data = load_data()
-    return jsonify(data['tracking_ids'])
+    """Get all tracking data, or one page of it when paging, filter or sort parameters are given"""
+    args = request.args
+    if not LIST_PARAMS & set(args):
+        return jsonify(store.records())
+    
+    sort = args.get('sort', 'tracking_id')
+    if sort not in SORT_FIELDS:
+        return jsonify({'success': False, 'error': f"sort must be one of: {', '.join(SORT_FIELDS)}"}), 400
+    order = args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        return jsonify({'success': False, 'error': 'order must be asc or desc'}), 400
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if not limit or not (1 <= limit <= MAX_PAGE_SIZE):
+        return jsonify({'success': False, 'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    filters = {field: args.get(field) for field in ['status', 'city', 'state', 'delivery_from', 'delivery_to']}
+    
+    store.sync()
+    try:
+        tracking_ids, next_cursor, total = shipment_index.query(
+            filters, sort=sort, descending=(order == 'desc'), cursor=args.get('cursor'), limit=limit)
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'items': [{'tracking_id': tid, **record} for tid, record in store.get_many(tracking_ids)],
+        'next_cursor': next_cursor,
+        'total': total
+    })
+
+@app.route('/api/tracking/search', methods=['GET'])
+def search_tracking():
+    """Find shipments whose name, address, city, state, zip or tracking ID words start with every query word"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'error': 'Query parameter q is required'}), 400
+    limit = request.args.get('limit', 20, type=int)
+    if not limit or not (1 <= limit <= MAX_SEARCH_RESULTS):
+        return jsonify({'success': False, 'error': f'limit must be between 1 and {MAX_SEARCH_RESULTS}'}), 400
+    
+    store.sync()
+    tracking_ids = search_index.search(query, limit=limit)
+    items = [{'tracking_id': tid, **record} for tid, record in store.get_many(tracking_ids)]
+    return jsonify({'success': True, 'query': query, 'items': items, 'count': len(items)})
 
 @app.route('/api/tracking/update/<tracking_id>', methods=['PUT'])
 def update_tracking(tracking_id):
     """Update tracking information"""
     tracking_data = request.json
-    data = load_data()
-    
-    if tracking_id not in data['tracking_ids']:
-        return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
-    
-    # Update only allowed fields
-    allowed_fields = ['name', 'address', 'city', 'state', 'zip', 'delivery_date', 'status', 'locations']
-    for field in allowed_fields:
-        if field in tracking_data:
-            data['tracking_ids'][tracking_id][field] = tracking_data[field]
     
-    data['tracking_ids'][tracking_id]['last_updated'] = str(datetime.now())
+    def apply_update(record):
+        apply_tracking_update(record, tracking_data)
     
-    save_data(data)
+    if store.update(tracking_id, apply_update) is None:
+        return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
     
     return jsonify({
         'success': True, 
@@ -664,28 +1179,14 @@ def update_tracking(tracking_id):
 @app.route('/api/tracking/delete/<tracking_id>', methods=['DELETE'])
 def delete_tracking(tracking_id):
     """Delete tracking ID"""
-    data = load_data()
+    # Store deleted tracking info for logging
+    deleted_tracking = store.delete(tracking_id)
     
-    if tracking_id not in data['tracking_ids']:
+    if deleted_tracking is None:
         return jsonify({'success': False, 'error': 'Tracking ID not found'}), 404
     
-    # Check if there's an image to delete
-    if 'image_url' in data['tracking_ids'][tracking_id]:
-        try:
-            image_url = data['tracking_ids'][tracking_id]['image_url']
-            filename = image_url.split('/')[-1]
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                print(f"🗑️ Deleted image file while deleting tracking ID: {filename}")
-        except Exception as e:
-            print(f"⚠️ Could not delete image file: {e}")
-    
-    # Store deleted tracking info for logging
-    deleted_tracking = data['tracking_ids'][tracking_id]
-    del data['tracking_ids'][tracking_id]
-    
-    save_data(data)
+    # Delete its image too, unless another shipment shares it
+    release_image(deleted_tracking.get('image_url'))
     
     return jsonify({
         'success': True, 
@@ -696,71 +1197,31 @@ def delete_tracking(tracking_id):
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get system statistics"""
-    data = load_data()
-    
-    # Calculate real-time stats
-    tracking_ids = data.get('tracking_ids', {})
-    
-    stats = data.get('system_stats', {})
-    
-    # Update stats with current values
-    stats['total_tracking_ids'] = len(tracking_ids)
-    stats['active_shipments'] = sum(
-        1 for t in tracking_ids.values() 
-        if t.get('status', '') in ['In Transit', 'Processing', 'Out for Delivery']
-    )
-    stats['delivered_today'] = sum(
-        1 for t in tracking_ids.values() 
-        if t.get('status', '') == 'Delivered' and 
-        t.get('last_updated', '').startswith(str(datetime.now().date()))
-    )
-    stats['images_count'] = sum(
-        1 for t in tracking_ids.values() 
-        if t.get('image_url') or t.get('image_base64')
-    )
-    stats['last_updated'] = str(datetime.now())
-    
-    # Save updated stats
-    data['system_stats'] = stats
-    save_data(data)
-    
-    return jsonify(stats)
-
-@app.route('/api/tracking/add', methods=['POST'])
-def add_tracking():
-    """Add new tracking ID"""
-    tracking_data = request.json
-    data = load_data()
-    
-    # Load system configuration for default location
-    config = load_config()
-    default_location = config.get('default_location', {
-        "city": "Berlin, Germany", 
-        "lat": 52.5200, 
-        "long": 13.4050
-    })
-    
-    tracking_id = tracking_data.get('tracking_id')
-    if not tracking_id or len(tracking_id) != 10:
-        return jsonify({'success': False, 'error': 'Tracking ID must be 10 characters'}), 400
-    
-    if tracking_id in data['tracking_ids']:
-        return jsonify({'success': False, 'error': 'Tracking ID already exists'}), 400
+    # Stats are maintained incrementally by the store, so this is a read-only lookup
+    stats = store.stats()
     
+    return cacheable_json(stats, last_modified=datetime.fromisoformat(stats['last_updated']).astimezone())
+
+def validate_tracking_id(tracking_id):
+    """Return an error message if tracking_id cannot be used for a new shipment, else None"""
+    if not isinstance(tracking_id, str) or len(tracking_id) != 10:
+        return 'Tracking ID must be 10 characters'
+    return None
+
+def new_tracking_record(tracking_data, default_location):
+    """Build the stored record for a new shipment from request data"""
     # Use custom location if provided, otherwise use default from config
     if 'locations' in tracking_data and tracking_data['locations']:
         # Use the location provided in the request
         locations = tracking_data['locations']
     else:
         # Use the system's default location
-        locations = [default_location]
+        locations = [dict(default_location)]
     
     # Set default delivery date if not provided (3 days from now)
-    delivery_date = tracking_data.get('delivery_date', 
-                                     str((datetime.now().replace(day=datetime.now().day + 3)).date()))
+    delivery_date = tracking_data.get('delivery_date', str((datetime.now() + timedelta(days=3)).date()))
     
-    # Create new tracking entry
-    new_tracking = {
+    return {
         'name': tracking_data.get('name', ''),
         'address': tracking_data.get('address', ''),
         'city': tracking_data.get('city', ''),
@@ -772,11 +1233,34 @@ def add_tracking():
         'created_at': str(datetime.now()),
         'last_updated': str(datetime.now())
     }
+
+def apply_tracking_update(record, tracking_data):
+    """Copy the updatable fields present in tracking_data onto record"""
+    for field in UPDATABLE_FIELDS:
+        if field in tracking_data:
+            record[field] = tracking_data[field]
+    record['last_updated'] = str(datetime.now())
+
+@app.route('/api/tracking/add', methods=['POST'])
+def add_tracking():
+    """Add new tracking ID"""
+    tracking_data = request.json
+    
+    default_location = get_default_location()
+    
+    tracking_id = tracking_data.get('tracking_id')
+    error = validate_tracking_id(tracking_id)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    
+    if tracking_id in store:
+        return jsonify({'success': False, 'error': 'Tracking ID already exists'}), 400
     
-    data['tracking_ids'][tracking_id] = new_tracking
+    new_tracking = new_tracking_record(tracking_data, default_location)
     
-    # Save data (which will update stats)
-    save_data(data)
+    # Save data (which will update stats); another worker may have added it meanwhile
+    if not store.add(tracking_id, new_tracking):
+        return jsonify({'success': False, 'error': 'Tracking ID already exists'}), 400
     
     return jsonify({
         'success': True, 
@@ -785,43 +1269,295 @@ def add_tracking():
         'data': new_tracking
     })
 
+def ndjson_items(stream):
+    """Yield (result, tracking_data) for each non-blank line of an NDJSON stream"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        result = {'line': line_number}
+        try:
+            tracking_data = json.loads(line)
+        except ValueError as e:
+            result['error'] = f'Invalid JSON: {e}'
+            tracking_data = None
+        yield result, tracking_data
+
+def ingest_shipments(items, merge, validate=None, on_result=None):
+    """Validate shipments and commit them in chunks of BULK_CHUNK_SIZE, one save per chunk.
+    
+    items yields (result, tracking_data) pairs, where result is the dict
+    reported for that shipment and may already hold a parse 'error'.
+    merge(tracking_id, current, tracking_data) returns the record to store,
+    or None to reject the shipment because it already exists. Each result
+    ends with a status of created, updated or error, and is passed to
+    on_result once it is final. Returns the count per status.
+    """
+    counts = {'created': 0, 'updated': 0, 'error': 0}
+    chunk = []
+    
+    def finish(result, status, error=None):
+        result['status'] = status
+        if error:
+            result['error'] = error
+        counts[status] += 1
+        if on_result is not None:
+            on_result(result)
+    
+    def commit():
+        outcomes = []
+        
+        def track(tracking_id, current, tracking_data):
+            record = merge(tracking_id, current, tracking_data)
+            outcomes.append(None if record is None else 'created' if current is None else 'updated')
+            return record
+        
+        saved = store.merge_many([(result['tracking_id'], tracking_data) for result, tracking_data in chunk], track)
+        for (result, _), outcome in zip(chunk, outcomes):
+            if saved is None:
+                finish(result, 'error', 'Failed to save')
+            elif outcome is None:
+                finish(result, 'error', 'Tracking ID already exists')
+            else:
+                finish(result, outcome)
+        chunk.clear()
+    
+    try:
+        for result, tracking_data in items:
+            if 'error' in result:
+                finish(result, 'error')
+                continue
+            if not isinstance(tracking_data, dict):
+                finish(result, 'error', 'Each shipment must be a JSON object')
+                continue
+            tracking_id = tracking_data.get('tracking_id')
+            result['tracking_id'] = tracking_id
+            error = validate_tracking_id(tracking_id) or (validate(tracking_data) if validate else None)
+            if error:
+                finish(result, 'error', error)
+                continue
+            chunk.append((result, tracking_data))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                commit()
+    finally:
+        # Shipments parsed before a malformed part of the upload are still committed
+        if chunk:
+            commit()
+    return counts
+
+@app.route('/api/tracking/bulk', methods=['POST'])
+def bulk_ingest():
+    """Create or update shipments from an NDJSON body, one shipment per line.
+    
+    mode=create (default) rejects tracking IDs that already exist, like
+    /api/tracking/add; mode=upsert updates them like /api/tracking/update.
+    Lines are committed in chunks of BULK_CHUNK_SIZE, each with a single
+    save, and every line gets its own result.
+    """
+    mode = request.args.get('mode', 'create')
+    if mode not in ('create', 'upsert'):
+        return jsonify({'success': False, 'error': 'mode must be create or upsert'}), 400
+    
+    default_location = get_default_location()
+    
+    def merge(tracking_id, current, tracking_data):
+        if current is None:
+            return new_tracking_record(tracking_data, default_location)
+        if mode == 'create':
+            return None
+        apply_tracking_update(current, tracking_data)
+        return current
+    
+    results = []
+    
+    def items():
+        for result, tracking_data in ndjson_items(io.BufferedReader(request.stream, 64 * 1024)):
+            results.append(result)
+            yield result, tracking_data
+    
+    counts = ingest_shipments(items(), merge, validate=validate_imported_shipment)
+    print(f"📥 Bulk ingest ({mode}): {counts['created']} created, {counts['updated']} updated, {counts['error']} failed")
+    
+    return jsonify({
+        'success': True,
+        'mode': mode,
+        'created': counts['created'],
+        'updated': counts['updated'],
+        'failed': counts['error'],
+        'results': results
+    })
+
+def export_json(data):
+    """Serialize the tracking_data.json layout one shipment at a time"""
+    yield '{"tracking_ids": {'
+    separator = ''
+    for tracking_id, record in data['tracking_ids'].items():
+        yield f"{separator}{json.dumps(tracking_id)}: {json.dumps(record.to_dict())}"
+        separator = ', '
+    yield f'}}, "system_stats": {json.dumps(data["system_stats"])}}}\n'
+
+def export_ndjson(data):
+    """One shipment per line, in the format /api/tracking/bulk accepts"""
+    for tracking_id, record in data['tracking_ids'].items():
+        yield json.dumps({'tracking_id': tracking_id, **record}) + '\n'
+
+def export_csv(data):
+    """One shipment per row with its current location flattened into columns"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for tracking_id, record in data['tracking_ids'].items():
+        location = (record.get('locations') or [{}])[0]
+        writer.writerow({
+            **record,
+            'tracking_id': tracking_id,
+            'location_city': location.get('city', ''),
+            'location_lat': location.get('lat', ''),
+            'location_long': location.get('long', '')
+        })
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def export_chunks(pieces, compress=False):
+    """Group serialized pieces into chunks of about EXPORT_CHUNK_SIZE bytes, optionally gzipped"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    chunk = []
+    size = 0
+    for piece in pieces:
+        piece = piece.encode()
+        chunk.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_SIZE:
+            data = b''.join(chunk)
+            chunk, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = b''.join(chunk)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
 # Backup/Export endpoint
 @app.route('/api/export', methods=['GET'])
 def export_data():
-    """Export all data"""
-    data = load_data()
-    return jsonify(data)
+    """Stream all data as JSON (the tracking_data.json layout), NDJSON or CSV, optionally gzipped"""
+    export_format = request.args.get('format', 'json')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    compress = request.args.get('compress') == 'gzip'
+    
+    # Records are never mutated in place, so this shallow snapshot stays consistent while it streams
+    data = store.export()
+    serializers = {'json': export_json, 'ndjson': export_ndjson, 'csv': export_csv}
+    
+    filename = f"tracking_data_{datetime.now().date()}.{export_format}"
+    mimetype = EXPORT_FORMATS[export_format]
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    headers = {'X-Total-Count': str(len(data['tracking_ids']))}
+    if export_format != 'json' or compress:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return Response(export_chunks(serializers[export_format](data), compress), mimetype=mimetype, headers=headers)
+
+def validate_imported_shipment(tracking_data):
+    """Return an error message if an imported shipment's fields or locations are malformed, else None"""
+    for field in IMPORT_TEXT_FIELDS:
+        if field in tracking_data and not isinstance(tracking_data[field], str):
+            return f'{field} must be a string'
+    locations = tracking_data.get('locations')
+    if locations is None:
+        return None
+    if not isinstance(locations, list):
+        return 'locations must be a list'
+    for location in locations:
+        if not isinstance(location, dict):
+            return 'Each location must be an object'
+        lat, long = location.get('lat'), location.get('long')
+        if not isinstance(lat, (int, float)) or not isinstance(long, (int, float)) \
+                or isinstance(lat, bool) or isinstance(long, bool):
+            return 'Each location needs numeric lat and long'
+        if not (-90 <= lat <= 90) or not (-180 <= long <= 180):
+            return 'Location coordinates out of range'
+    return None
 
 # Import endpoint
 @app.route('/api/import', methods=['POST'])
 def import_data():
-    """Import data"""
+    """Import shipments from a JSON or NDJSON upload, parsed and committed incrementally.
+    
+    JSON uploads may use the tracking_data.json layout or be a bare
+    {tracking_id: record} mapping; NDJSON uploads (format=ndjson or an
+    application/x-ndjson body) hold one shipment per line, as exported.
+    mode=replace (default) makes the upload the whole dataset; mode=merge
+    inserts new shipments and replaces existing ones, keeping the rest.
+    """
+    mode = request.args.get('mode', 'replace')
+    if mode not in ('replace', 'merge'):
+        return jsonify({'success': False, 'error': 'mode must be replace or merge'}), 400
+    ndjson = request.args.get('format') == 'ndjson' or request.mimetype == 'application/x-ndjson'
+    
+    default_location = get_default_location()
+    
+    def merge(tracking_id, current, tracking_data):
+        # The uploaded shipment replaces the stored one; missing fields get add_tracking's defaults
+        record = new_tracking_record(tracking_data, default_location)
+        record.update((field, value) for field, value in tracking_data.items() if field != 'tracking_id')
+        return record
+    
+    stream = io.BufferedReader(request.stream, 64 * 1024)
+    
+    def items():
+        if ndjson:
+            yield from ndjson_items(stream)
+            return
+        for tracking_id, tracking_data in iter_shipments(stream):
+            if isinstance(tracking_data, dict):
+                tracking_data = {**tracking_data, 'tracking_id': tracking_id}
+            yield {'tracking_id': tracking_id}, tracking_data
+    
+    seen = set()
+    errors = []
+    
+    def on_result(result):
+        if isinstance(result.get('tracking_id'), str):
+            seen.add(result['tracking_id'])
+        if result['status'] == 'error' and len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(result)
+    
     try:
-        import_data = request.json
-        
-        # Validate data structure
-        if not isinstance(import_data, dict):
-            return jsonify({'success': False, 'error': 'Invalid data format'}), 400
-        
-        # If data has tracking_ids key, use that structure
-        if 'tracking_ids' in import_data:
-            data_to_save = import_data
-        else:
-            # Assume it's tracking_ids data
-            data_to_save = {
-                'tracking_ids': import_data,
-                'system_stats': load_data().get('system_stats', {})
-            }
-        
-        save_data(data_to_save)
-        
+        counts = ingest_shipments(items(), merge, validate=validate_imported_shipment, on_result=on_result)
+    except ValueError as e:
+        # A truncated or malformed upload must not delete the shipments it never reached
         return jsonify({
-            'success': True, 
-            'message': 'Data imported successfully',
-            'imported_count': len(data_to_save.get('tracking_ids', {}))
-        })
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 400
+            'success': False,
+            'error': f'Invalid upload: {e}',
+            'message': 'Shipments before the error were imported; nothing was deleted',
+            'errors': errors
+        }), 400
+    
+    deleted = 0
+    if mode == 'replace':
+        deleted = store.delete_many([tid for tid in store.records() if tid not in seen])
+    
+    imported = counts['created'] + counts['updated']
+    print(f"📥 Import ({mode}): {counts['created']} created, {counts['updated']} updated, "
+          f"{deleted} removed, {counts['error']} failed")
+    
+    return jsonify({
+        'success': True, 
+        'message': 'Data imported successfully',
+        'mode': mode,
+        'imported_count': imported,
+        'created': counts['created'],
+        'updated': counts['updated'],
+        'deleted': deleted,
+        'failed': counts['error'],
+        'errors': errors
+    })
 
 # Test endpoint for checking functionality
 @app.route('/api/test', methods=['GET'])
@@ -848,20 +1584,23 @@ def reset_data():
     
     try:
         # Remove existing data files
-        for file_path in [DATA_FILE, CONFIG_FILE]:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"🗑️ Deleted: {file_path}")
+        store.reset()
+        if os.path.exists(CONFIG_FILE):
+            os.remove(CONFIG_FILE)
+            print(f"🗑️ Deleted: {CONFIG_FILE}")
         
-        # Remove uploads (except sample)
+        # Remove uploads (except sample), shard folders included
         if os.path.exists(UPLOAD_FOLDER):
-            for file in os.listdir(UPLOAD_FOLDER):
-                if file != 'sample_package.jpg':
-                    os.remove(os.path.join(UPLOAD_FOLDER, file))
+            with os.scandir(UPLOAD_FOLDER) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    elif entry.name != 'sample_package.jpg':
+                        os.remove(entry.path)
         
         # Reload fresh data
-        load_config()
-        load_data()
+        config_store.ensure_file()
+        store.sync()
         
         return jsonify({
             'success': True, 
@@ -880,6 +1619,10 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+@app.errorhandler(SaveError)
+def save_failed(error):
+    return jsonify({'success': False, 'error': 'Could not save tracking data'}), 500
+
 @app.errorhandler(400)
 def bad_request(error):
     return jsonify({'error': 'Bad request'}), 400
@@ -896,7 +1639,8 @@ if __name__ == '__main__':
     
     # Load initial data and config
     config = load_config()
-    data = load_data()
+    stats = store.stats()
+    tracking_ids = list(store.records().keys())
     
     print(f"\n📍 System Information:")
     print(f"   • Version: {config.get('version', '2.0.0')}")
@@ -905,9 +1649,9 @@ if __name__ == '__main__':
     print(f"   • Deployment: {'Production' if IS_PRODUCTION else 'Development'}")
     
     print(f"\n📊 Initial Data Loaded:")
-    print(f"   • Tracking IDs: {len(data.get('tracking_ids', {}))}")
-    print(f"   • Active Shipments: {data.get('system_stats', {}).get('active_shipments', 0)}")
-    print(f"   • Images: {data.get('system_stats', {}).get('images_count', 0)}")
+    print(f"   • Tracking IDs: {len(tracking_ids)}")
+    print(f"   • Active Shipments: {stats.get('active_shipments', 0)}")
+    print(f"   • Images: {stats.get('images_count', 0)}")
     
     print(f"\n🌐 Available Endpoints:")
     print(f"   • Main Tracking: {BASE_URL}/")
@@ -915,6 +1659,7 @@ if __name__ == '__main__':
     print(f"   • Location Config: {BASE_URL}/admin/location")
     print(f"   • Health Check: {BASE_URL}/health")
     print(f"   • System Status: {BASE_URL}/api/status")
+    print(f"   • Live Updates: {BASE_URL}/api/tracking/<id>/stream")
     print(f"   • Test Endpoint: {BASE_URL}/api/test")
     
     print(f"\n🔑 Admin Credentials:")
@@ -922,11 +1667,11 @@ if __name__ == '__main__':
     print(f"   • Password: admin123")
     
     print(f"\n📦 Sample Tracking IDs:")
-    for tracking_id in list(data.get('tracking_ids', {}).keys())[:3]:
+    for tracking_id in tracking_ids[:3]:
         print(f"   • {tracking_id}")
     
-    if len(data.get('tracking_ids', {})) > 3:
-        print(f"   • ... and {len(data.get('tracking_ids', {})) - 3} more")
+    if len(tracking_ids) > 3:
+        print(f"   • ... and {len(tracking_ids) - 3} more")
     
     print(f"\n📁 Data Files:")
     print(f"   • Tracking Data: {DATA_FILE}")
@@ -0,0 +1,110 @@
+import copy
+import json
+import threading
+import time
+from types import MappingProxyType
+
+from storage import FileLock, _file_signature, atomic_write_json
+
+
+def freeze(value):
+    """Read-only view of parsed JSON: objects become mapping proxies and arrays tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Plain, mutable JSON data back from freeze()"""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class ConfigStore:
+    """system_config.json held in memory as an immutable snapshot.
+
+    Reads return the current snapshot and check the file for changes at most
+    once every refresh_interval seconds; they never write. Missing fields are
+    filled from defaults and the fields in overrides (values derived from the
+    environment, such as base_url) are applied in memory, not saved. Writes
+    go through update(), serialized across workers by a file lock.
+    """
+
+    def __init__(self, path, defaults, overrides=None, refresh_interval=1.0):
+        self.path = path
+        self.defaults = defaults
+        self.overrides = overrides or {}
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + '.lock')
+        self._snapshot = None
+        self._signature = None
+        self._checked_at = 0
+
+    def get(self):
+        """Return the current configuration as a read-only mapping"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.refresh_interval:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            signature = _file_signature(self.path)
+            if self._snapshot is None or signature != self._signature:
+                self._load(signature)
+            return self._snapshot
+
+    def _load(self, signature):
+        stored = {}
+        if signature is not None:
+            try:
+                with open(self.path, 'r') as f:
+                    stored = json.load(f)
+                if not isinstance(stored, dict):
+                    raise ValueError('the top level must be an object')
+            except Exception as e:
+                if self._snapshot is not None:
+                    # Keep serving the last good configuration until the file changes again
+                    print(f"⚠️ Error reloading config, keeping the current one: {e}")
+                    self._signature = signature
+                    return
+                print(f"⚠️ Error loading config, using default: {e}")
+                stored = {}
+        self._set(stored, signature)
+
+    def _set(self, stored, signature):
+        config = copy.deepcopy(self.defaults)
+        config.update(stored)
+        config.update(self.overrides)
+        self._snapshot = freeze(config)
+        self._signature = signature
+
+    def ensure_file(self):
+        """Write the defaults out if there is no config file yet, so admins have one to edit"""
+        with self._lock, self._file_lock:
+            if _file_signature(self.path) is None:
+                print(f"📝 Creating new config file at: {self.path}")
+                config = copy.deepcopy(self.defaults)
+                config.update(self.overrides)
+                atomic_write_json(self.path, config)
+                self._set(config, _file_signature(self.path))
+
+    def update(self, apply):
+        """Apply apply(config) to a mutable copy of the stored configuration and save it.
+
+        Returns the new snapshot; raises if the file cannot be written.
+        """
+        with self._lock, self._file_lock:
+            signature = _file_signature(self.path)
+            if self._snapshot is None or signature != self._signature:
+                self._load(signature)
+            config = thaw(self._snapshot)
+            apply(config)
+            atomic_write_json(self.path, config)
+            self._set(config, _file_signature(self.path))
+            self._checked_at = time.monotonic()
+            return self._snapshot
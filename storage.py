@@ -0,0 +1,406 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from collections.abc import Mapping
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; writers are then only serialized within one process
+    fcntl = None
+
+
+def _json_default(value):
+    """Serialize read-only mapping types, such as the store's compact records, as objects"""
+    if isinstance(value, Mapping):
+        return value.to_dict() if hasattr(value, 'to_dict') else dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(value):
+    return json.dumps(value, default=_json_default)
+
+
+def atomic_write_json(path, data, indent=4):
+    """Write JSON to path so readers see either the old or the new file, never a partial one"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent, default=_json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory):
+    """Make a rename durable; not every platform can open a directory"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class JsonFileBackend:
+    """Stores the dataset in tracking_data.json plus a write-ahead journal.
+
+    Each mutation is appended to <path>.journal and fsynced before it is
+    acknowledged. Every compact_every entries the journal is folded into a new
+    snapshot written with atomic_write_json() and truncated. On load the
+    journal is replayed on top of the snapshot, so a crash at any point loses
+    at most a torn final journal line, which the next save cuts off.
+    """
+
+    def __init__(self, path, compact_every=100):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compact_every = compact_every
+        self._journal_entries = 0
+
+    def signature(self):
+        """Change token for the stored data: snapshot and journal inode, mtime and size"""
+        snapshot = _file_signature(self.path)
+        if snapshot is None:
+            return None
+        return (snapshot, _file_signature(self.journal_path))
+
+    def load(self):
+        """Return the stored dataset, or None if nothing has been stored yet"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        data.setdefault('tracking_ids', {})
+
+        entries = self._read_journal()
+        for entry in entries:
+            if entry['op'] == 'put':
+                data['tracking_ids'][entry['id']] = entry['record']
+            elif entry['op'] == 'delete':
+                data['tracking_ids'].pop(entry['id'], None)
+            if 'stats' in entry:
+                data['system_stats'] = entry['stats']
+        if entries:
+            print(f"🔁 Replayed {len(entries)} journal entries from {self.journal_path}")
+        self._journal_entries = len(entries)
+        return data
+
+    def _read_journal(self):
+        """Return the complete journal entries.
+
+        Reading never changes the file: an incomplete last line may be an
+        append another worker is still writing. It is skipped here and only
+        cut off by save(), under the write lock.
+        """
+        try:
+            return self._scan_journal()[0]
+        except FileNotFoundError:
+            return []
+
+    def _scan_journal(self):
+        entries = []
+        good_bytes = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('unterminated entry')
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+                good_bytes += len(line)
+        return entries, good_bytes
+
+    def _repair_journal(self):
+        """Cut off a torn last entry left by a crash mid-append; call only with the write lock held"""
+        try:
+            size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return
+        if not size:
+            return
+        with open(self.journal_path, 'rb') as f:
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+        entries, good_bytes = self._scan_journal()
+        if good_bytes < size:
+            # The mutation was never acknowledged; later appends must start on a clean line
+            print(f"⚠️ Dropping incomplete journal entry in {self.journal_path}")
+            with open(self.journal_path, 'rb+') as f:
+                f.truncate(good_bytes)
+        self._journal_entries = len(entries)
+
+    def save(self, data, changed=None, deleted=()):
+        """Journal the changed records, or write a full snapshot when changed is None"""
+        if changed is None or not os.path.exists(self.path):
+            self.compact(data)
+            return
+
+        tracking_ids = data.get('tracking_ids', {})
+        lines = [_dumps({'op': 'put', 'id': tid, 'record': tracking_ids[tid]})
+                 for tid in changed if tid in tracking_ids]
+        lines += [json.dumps({'op': 'delete', 'id': tid}) for tid in deleted]
+        lines.append(json.dumps({'op': 'stats', 'stats': data.get('system_stats', {})}))
+
+        self._repair_journal()
+        with open(self.journal_path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_entries += len(lines)
+
+        if self._journal_entries >= self.compact_every:
+            self.compact(data)
+
+    def compact(self, data):
+        """Write a fresh snapshot and empty the journal"""
+        atomic_write_json(self.path, data)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+
+    def clear(self):
+        for path in [self.path, self.journal_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def lock_path(self):
+        return self.path + '.lock'
+
+    def describe(self):
+        return f"JSON file {self.path}"
+
+
+class SqliteBackend:
+    """Stores one row per tracking ID so a mutation only writes the records it touched.
+
+    Every commit bumps a revision counter kept in meta; rows and tombstones
+    carry the revision that last touched them, so another worker can catch up
+    with load_changes() instead of re-reading the whole table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._rev = 0
+
+    def _connect(self):
+        # SQLite connections must not be shared across fork()ed gunicorn workers
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            conn.execute('CREATE TABLE IF NOT EXISTS shipments ('
+                         'tracking_id TEXT PRIMARY KEY, record TEXT NOT NULL, '
+                         'rev INTEGER NOT NULL DEFAULT 0)')
+            conn.execute('CREATE TABLE IF NOT EXISTS tombstones ('
+                         'tracking_id TEXT PRIMARY KEY, rev INTEGER NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta ('
+                         'key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(shipments)')]
+            if 'rev' not in columns:
+                conn.execute('ALTER TABLE shipments ADD COLUMN rev INTEGER NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS shipments_rev ON shipments (rev)')
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _meta(self, conn, key, default=None):
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, conn, key, value):
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def signature(self):
+        """Change token for the stored data.
+
+        PRAGMA data_version only moves when another connection commits, so our
+        own writes never look like external changes.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            version = self._connect().execute('PRAGMA data_version').fetchone()[0]
+        return (st.st_ino, version)
+
+    def load(self):
+        """Return the stored dataset, or None if nothing has been stored yet"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                stats = self._meta(conn, 'system_stats')
+                if stats is None:
+                    return None
+                tracking_ids = {
+                    tracking_id: json.loads(record)
+                    for tracking_id, record in conn.execute('SELECT tracking_id, record FROM shipments')
+                }
+                self._rev = self._meta(conn, 'rev', 0)
+            finally:
+                conn.execute('COMMIT')
+        return {'tracking_ids': tracking_ids, 'system_stats': stats}
+
+    def load_changes(self):
+        """Return (changed records, deleted IDs, stats) committed since our last load or save.
+
+        Returns None when a full reload is required, e.g. after another worker
+        replaced or cleared the whole dataset.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                stats = self._meta(conn, 'system_stats')
+                if stats is None or self._meta(conn, 'base_rev', 0) > self._rev:
+                    return None
+                changed = {
+                    tracking_id: json.loads(record)
+                    for tracking_id, record in conn.execute(
+                        'SELECT tracking_id, record FROM shipments WHERE rev > ?', (self._rev,))
+                }
+                deleted = [row[0] for row in conn.execute(
+                    'SELECT tracking_id FROM tombstones WHERE rev > ?', (self._rev,))]
+                self._rev = self._meta(conn, 'rev', 0)
+            finally:
+                conn.execute('COMMIT')
+        return changed, deleted, stats
+
+    def save(self, data, changed=None, deleted=()):
+        """Persist changed and deleted records; changed=None rewrites every record"""
+        tracking_ids = data.get('tracking_ids', {})
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rev = self._meta(conn, 'rev', 0) + 1
+                if changed is None:
+                    conn.execute('DELETE FROM shipments')
+                    conn.execute('DELETE FROM tombstones')
+                    self._set_meta(conn, 'base_rev', rev)
+                    changed = tracking_ids.keys()
+                rows = [(tid, _dumps(tracking_ids[tid]), rev) for tid in changed if tid in tracking_ids]
+                conn.executemany(
+                    'INSERT OR REPLACE INTO shipments (tracking_id, record, rev) VALUES (?, ?, ?)', rows)
+                conn.executemany('DELETE FROM tombstones WHERE tracking_id = ?', [(row[0],) for row in rows])
+                conn.executemany('DELETE FROM shipments WHERE tracking_id = ?', [(tid,) for tid in deleted])
+                conn.executemany('INSERT OR REPLACE INTO tombstones (tracking_id, rev) VALUES (?, ?)',
+                                 [(tid, rev) for tid in deleted])
+                self._set_meta(conn, 'system_stats', data.get('system_stats', {}))
+                self._set_meta(conn, 'rev', rev)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self._rev = rev
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM shipments')
+            conn.execute('DELETE FROM tombstones')
+            conn.execute('DELETE FROM meta')
+            conn.execute('COMMIT')
+
+    def lock_path(self):
+        return self.path + '.lock'
+
+    def describe(self):
+        return f"SQLite database {self.path}"
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, shared by every worker process.
+
+    Only writers take it; readers keep serving from memory. Re-entrant within
+    one process, and falls back to a no-op where fcntl is unavailable.
+    Callers must serialize threads themselves: flock() does not exclude two
+    threads sharing one descriptor.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        if self._fd is None or self._pid != os.getpid():
+            # A descriptor inherited across fork() shares its lock with the parent
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+            self._depth = 0
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is None:
+            return
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def create_backend(kind, data_file, db_file, compact_every=100):
+    """Create the storage backend selected by STORAGE_BACKEND ('sqlite' or 'json')"""
+    if kind == 'json':
+        return JsonFileBackend(data_file, compact_every=compact_every)
+    if kind == 'sqlite':
+        backend = SqliteBackend(db_file)
+        # Several workers may start at once; only the first one seeds the database
+        with FileLock(backend.lock_path()):
+            if backend.load() is None and os.path.exists(data_file):
+                import_json_file(data_file, backend)
+        return backend
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def import_json_file(json_path, backend):
+    """Copy a dataset in the tracking_data.json layout into another backend"""
+    data = JsonFileBackend(json_path).load()
+    data.setdefault('tracking_ids', {})
+    data.setdefault('system_stats', {})
+    backend.save(data)
+    print(f"📥 Imported {len(data['tracking_ids'])} tracking IDs from {json_path} into {backend.describe()}")
+    return len(data['tracking_ids'])
+
+
+if __name__ == '__main__':
+    # Usage: python storage.py [tracking_data.json] [tracking_data.db]
+    json_path = sys.argv[1] if len(sys.argv) > 1 else 'tracking_data.json'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else 'tracking_data.db'
+    import_json_file(json_path, SqliteBackend(db_path))
@@ -0,0 +1,425 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from compact import compact
+from storage import FileLock
+
+ACTIVE_STATUSES = ['In Transit', 'Processing', 'Out for Delivery']
+
+
+class SaveError(RuntimeError):
+    """A write could not be persisted; the store went back to what is stored"""
+
+
+class StatsCounters:
+    """System statistics kept up to date as deltas while records are added, changed and removed.
+
+    delivered_today is answered from a count of delivered shipments per
+    last_updated date, so the day rollover needs no rescan.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.active = 0
+        self.images = 0
+        self.delivered_by_day = {}
+        self.last_updated = str(datetime.now())
+
+    def apply(self, record, sign):
+        """Count a record in (sign=1) or out (sign=-1)"""
+        self.total += sign
+        status = record.get('status', '')
+        if status in ACTIVE_STATUSES:
+            self.active += sign
+        elif status == 'Delivered':
+            day = record.get('last_updated', '')[:10]
+            count = self.delivered_by_day.get(day, 0) + sign
+            if count:
+                self.delivered_by_day[day] = count
+            else:
+                self.delivered_by_day.pop(day, None)
+        if record.get('image_url') or record.get('image_base64'):
+            self.images += sign
+
+    def snapshot(self):
+        return {
+            'total_tracking_ids': self.total,
+            'active_shipments': self.active,
+            'delivered_today': self.delivered_by_day.get(str(datetime.now().date()), 0),
+            'images_count': self.images,
+            'last_updated': self.last_updated
+        }
+
+
+def stamp_locations(previous, record):
+    """Give new or changed location points a sequence number above every earlier one.
+
+    locations is ordered newest first. record['location_seq'] is the highest
+    number handed out for the shipment, so clients can ask for the points
+    recorded after a version they already have. Returns the stamped points,
+    oldest first.
+    """
+    old_points = {}
+    top = 0
+    if previous is not None:
+        old_points = {point.get('seq'): point for point in previous.get('locations') or []}
+        top = previous.get('location_seq', 0)
+    stamped = []
+    for point in reversed(record.get('locations') or []):
+        seq = point.get('seq')
+        if seq is None or old_points.get(seq) != point:
+            top += 1
+            point['seq'] = top
+            stamped.append(point)
+    record['location_seq'] = top
+    return stamped
+
+
+class ShipmentStore:
+    """In-memory tracking data, loaded once and reloaded when the backend reports a change.
+
+    Stored records are read-only CompactShipment mappings that are never
+    mutated in place: update() and merge_many() change a private copy of the
+    current record and store it as a new one, so readers can iterate a
+    shallow copy of the mapping without locking.
+
+    Writes are serialized across gunicorn workers by a file lock. A writer
+    catches up with other workers' commits after taking the lock and before
+    reading the record it changes, so a read-modify-write through update()
+    or merge_many() never loses another worker's update. Reads never take the file lock, and
+    check the backend for changes at most once every refresh_interval seconds.
+
+    With a LocationHistory, every location point a write adds or changes is
+    also appended to the shipment's history, and the record itself keeps only
+    its record_locations newest points.
+    """
+
+    def __init__(self, backend, default_factory, refresh_interval=0, history=None, record_locations=None):
+        self.backend = backend
+        self.default_factory = default_factory
+        self.refresh_interval = refresh_interval
+        self.history = history
+        self.record_locations = record_locations
+        self._new_points = []
+        self._checked_at = 0
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(backend.lock_path())
+        self._tracking_ids = {}
+        self._stats = StatsCounters()
+        self._signature = None
+        self._loaded = False
+        self._listeners = []
+
+    def _ensure_fresh(self, force=False):
+        """Reload the dataset if the stored data was modified externally"""
+        now = time.monotonic()
+        if self._loaded and not force and now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        signature = self.backend.signature()
+        if self._loaded and signature == self._signature:
+            return
+        with self._lock:
+            signature = self.backend.signature()
+            if self._loaded and signature == self._signature:
+                return
+            self._reload(signature)
+
+    def _reload(self, signature):
+        if self._loaded and hasattr(self.backend, 'load_changes'):
+            changes = self.backend.load_changes()
+            if changes is not None:
+                changed, deleted, stats = changes
+                for tracking_id, record in changed.items():
+                    self._set_record(tracking_id, record)
+                for tracking_id in deleted:
+                    self._remove_record(tracking_id)
+                self._stats.last_updated = stats.get('last_updated', self._stats.last_updated)
+                self._signature = signature
+                return
+
+        try:
+            data = self.backend.load()
+        except Exception as e:
+            print(f"❌ Error loading data: {e}")
+            if not self._loaded:
+                # Never paper over unreadable data with the sample dataset; the
+                # next write would overwrite every stored shipment
+                raise
+            # Keep serving what we have until the stored data changes again
+            self._signature = signature
+            return
+
+        if data is None:
+            with self._file_lock:
+                # Another worker may have created it while we waited for the lock
+                data = self.backend.load()
+                if data is None:
+                    print(f"📦 Creating new tracking data in {self.backend.describe()}")
+                    self._set_data(self.default_factory())
+                    try:
+                        self._write()
+                    except SaveError:
+                        pass  # Serve the defaults from memory; the next write tries again
+                    return
+
+        self._set_data(data)
+        self._signature = signature
+        print(f"📂 Loaded {len(self._tracking_ids)} tracking IDs from {self.backend.describe()}")
+
+    def _set_data(self, data):
+        """Replace the in-memory dataset; the only place statistics are counted from scratch"""
+        previous_ids = self._tracking_ids
+        self._tracking_ids = {tid: compact(record) for tid, record in data.get('tracking_ids', {}).items()}
+        self._stats = StatsCounters()
+        for record in self._tracking_ids.values():
+            self._stats.apply(record, 1)
+        last_updated = data.get('system_stats', {}).get('last_updated')
+        if last_updated:
+            self._stats.last_updated = last_updated
+        self._loaded = True
+        if self._listeners:
+            for tracking_id in previous_ids.keys() - self._tracking_ids.keys():
+                self._notify(tracking_id, None)
+            for tracking_id, record in self._tracking_ids.items():
+                self._notify(tracking_id, record)
+
+    def _set_record(self, tracking_id, record):
+        record = compact(record)
+        previous = self._tracking_ids.get(tracking_id)
+        if previous is not None:
+            self._stats.apply(previous, -1)
+        self._tracking_ids[tracking_id] = record
+        self._stats.apply(record, 1)
+        self._notify(tracking_id, record)
+
+    def _write_record(self, tracking_id, record):
+        """Store a record written through this store's API"""
+        stamped = stamp_locations(self._tracking_ids.get(tracking_id), record)
+        if stamped and self.history is not None:
+            self._new_points.append((tracking_id, stamped))
+        if self.record_locations and len(record.get('locations') or []) > self.record_locations:
+            record['locations'] = record['locations'][:self.record_locations]
+        self._set_record(tracking_id, record)
+
+    def _remove_record(self, tracking_id):
+        record = self._tracking_ids.pop(tracking_id, None)
+        if record is not None:
+            self._stats.apply(record, -1)
+            self._notify(tracking_id, None)
+        return record
+
+    def _notify(self, tracking_id, record):
+        for listener in self._listeners:
+            listener(tracking_id, record)
+
+    def add_listener(self, listener):
+        """Call listener(tracking_id, record) whenever a record changes in memory.
+
+        record is None for deletions and must be treated as read-only. Listeners
+        run under the store lock and must not block. A listener added after the
+        data was loaded is first called once for every existing record.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self._loaded:
+                for tracking_id, record in self._tracking_ids.items():
+                    listener(tracking_id, record)
+
+    def refresh(self):
+        """Pick up writes made by other workers now"""
+        self._ensure_fresh(force=True)
+
+    def sync(self):
+        """Catch up with other workers' writes, checking at most once every refresh_interval seconds.
+
+        Call it before reading a listener-maintained index, which only sees
+        changes the store has loaded.
+        """
+        self._ensure_fresh()
+
+    def _write(self, changed=None, deleted=()):
+        """Persist the in-memory dataset; changed/deleted name the records that moved"""
+        self._stats.last_updated = str(datetime.now())
+        data = {'tracking_ids': self._tracking_ids, 'system_stats': self._stats.snapshot()}
+        new_points, self._new_points = self._new_points, []
+        try:
+            self.backend.save(data, changed=changed, deleted=deleted)
+        except Exception as e:
+            print(f"❌ Error saving data: {e}")
+            raise SaveError(f'Could not save tracking data: {e}') from e
+        # Our own write must not look like an external change
+        self._signature = self.backend.signature()
+        if self.history is not None:
+            try:
+                if new_points:
+                    self.history.append_many(new_points)
+                if deleted:
+                    self.history.delete(deleted)
+            except Exception as e:
+                # The shipment is saved; a gap in its trail is not worth failing the write
+                print(f"⚠️ Error recording location history: {e}")
+        return True
+
+    def _discard_unsaved(self):
+        """Go back to the stored data after a write failed partway or could not be saved.
+
+        Backends persist only the records a save names, so a change kept in
+        memory would never reach the disk or the other workers.
+        """
+        self._new_points = []
+        try:
+            self._set_data(self.backend.load() or self.default_factory())
+            self._signature = self.backend.signature()
+        except Exception as e:
+            print(f"❌ Error reloading data after a failed save: {e}")
+            # Load from scratch on the next access
+            self._loaded = False
+            self._signature = None
+
+    # Read API
+
+    def __contains__(self, tracking_id):
+        self._ensure_fresh()
+        return tracking_id in self._tracking_ids
+
+    def get(self, tracking_id):
+        """Return a private copy of a shipment record, or None"""
+        self._ensure_fresh()
+        record = self._tracking_ids.get(tracking_id)
+        return record.to_dict() if record is not None else None
+
+    def get_many(self, tracking_ids):
+        """Return read-only records for the given tracking IDs that exist, in order"""
+        self._ensure_fresh()
+        records = self._tracking_ids
+        return [(tid, records[tid]) for tid in tracking_ids if tid in records]
+
+    def records(self):
+        """Return a read-only snapshot of the tracking_ids mapping"""
+        self._ensure_fresh()
+        return dict(self._tracking_ids)
+
+    def count(self):
+        self._ensure_fresh()
+        return len(self._tracking_ids)
+
+    def stats(self):
+        self._ensure_fresh()
+        return self._stats.snapshot()
+
+    def export(self):
+        """Return the dataset in the tracking_data.json layout"""
+        self._ensure_fresh()
+        return {'tracking_ids': dict(self._tracking_ids), 'system_stats': self._stats.snapshot()}
+
+    # Write API
+
+    @contextmanager
+    def _writing(self):
+        """Serialize a write across threads and worker processes on fresh data"""
+        with self._lock, self._file_lock:
+            self._ensure_fresh(force=True)
+            try:
+                yield
+            except BaseException:
+                # Records applied before the failure must not outlive it in memory
+                self._discard_unsaved()
+                raise
+
+    def locked(self):
+        """Context manager that holds off writers in every worker, with the records and listeners fresh"""
+        return self._writing()
+
+    def update(self, tracking_id, apply):
+        """Apply apply(record) to a copy of the current record and persist it.
+
+        Returns the updated record, or None if the tracking ID does not exist.
+        Raises SaveError if the change could not be saved.
+        """
+        with self._writing():
+            record = self._tracking_ids.get(tracking_id)
+            if record is None:
+                return None
+            record = record.to_dict()
+            apply(record)
+            self._write_record(tracking_id, record)
+            self._write(changed=[tracking_id])
+            return self._tracking_ids[tracking_id].to_dict()
+
+    def update_all(self, apply):
+        """Apply apply(record) to a copy of every record; it returns True for records it changed.
+
+        Returns the number of records changed, all persisted with a single save.
+        Raises SaveError if the save failed; then no record is changed.
+        """
+        with self._writing():
+            changed = []
+            for tracking_id, record in list(self._tracking_ids.items()):
+                record = record.to_dict()
+                if apply(record):
+                    self._write_record(tracking_id, record)
+                    changed.append(tracking_id)
+            if changed:
+                self._write(changed=changed)
+            return len(changed)
+
+    def add(self, tracking_id, record):
+        """Insert a new shipment record; returns False if the tracking ID already exists, raises SaveError"""
+        with self._writing():
+            if tracking_id in self._tracking_ids:
+                return False
+            self._write_record(tracking_id, record)
+            return self._write(changed=[tracking_id])
+
+    def merge_many(self, entries, merge):
+        """Store merge(tracking_id, current, payload) for each (tracking_id, payload) with a single save.
+
+        current is a private copy of the stored record, or None if there is
+        none; merge returns the record to store, or None to leave it alone.
+        Returns the stored records in entry order (None where skipped), or
+        None if the save failed.
+        """
+        try:
+            with self._writing():
+                stored = []
+                changed = {}
+                for tracking_id, payload in entries:
+                    current = self._tracking_ids.get(tracking_id)
+                    record = merge(tracking_id, current.to_dict() if current is not None else None, payload)
+                    if record is not None:
+                        self._write_record(tracking_id, record)
+                        changed[tracking_id] = True
+                    stored.append(record)
+                if changed:
+                    self._write(changed=list(changed))
+                return stored
+        except SaveError:
+            return None
+
+    def delete(self, tracking_id):
+        """Remove a shipment record and return it, or None if it did not exist; raises SaveError"""
+        with self._writing():
+            record = self._remove_record(tracking_id)
+            if record is not None:
+                self._write(changed=[], deleted=[tracking_id])
+            return record
+
+    def delete_many(self, tracking_ids):
+        """Remove several shipment records with a single save; returns how many existed, raises SaveError"""
+        with self._writing():
+            deleted = [tid for tid in tracking_ids if self._remove_record(tid) is not None]
+            if deleted:
+                self._write(changed=[], deleted=deleted)
+            return len(deleted)
+
+    def reset(self):
+        """Drop all stored data; the next access recreates the default dataset"""
+        with self._lock, self._file_lock:
+            self.backend.clear()
+            if self.history is not None:
+                self.history.clear()
+            self._loaded = False
+            self._signature = None
@@ -0,0 +1,112 @@
+"""Stress test: N worker processes hammer /api/tracking/update and no update may be lost.
+
+Each process imports the app on its own, exactly like a gunicorn worker, so
+every process has its own in-memory store and only the storage backend and
+its lock file are shared. Every process updates its own tracking ID and one
+field of a shared tracking ID; afterwards each of those fields must hold
+that process's last value.
+
+Usage: python stress_update.py [--processes 8] [--updates 50] [--backend sqlite|json]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+SHARED_ID = 'STRESS0000'
+SHARED_FIELDS = ['name', 'address', 'city', 'state', 'zip', 'delivery_date']
+
+
+def own_id(index):
+    return f"STRESS{index + 1:04d}"
+
+
+def open_app(data_dir, backend):
+    os.chdir(data_dir)
+    os.environ['STORAGE_BACKEND'] = backend
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+    return server.app.test_client()
+
+
+def worker(index, updates, data_dir, backend, start):
+    client = open_app(data_dir, backend)
+    start.wait()
+    for k in range(updates):
+        response = client.put(f'/api/tracking/update/{own_id(index)}', json={'zip': str(k)})
+        assert response.status_code == 200, response.get_json()
+        if index < len(SHARED_FIELDS):
+            field = SHARED_FIELDS[index]
+            response = client.put(f'/api/tracking/update/{SHARED_ID}', json={field: f"p{index}-{k}"})
+            assert response.status_code == 200, response.get_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--backend', choices=['sqlite', 'json'], default='sqlite')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='tracking-stress-')
+    try:
+        ctx = multiprocessing.get_context('spawn')
+        client = open_app(data_dir, args.backend)
+        for tracking_id in [SHARED_ID] + [own_id(i) for i in range(args.processes)]:
+            client.post('/api/tracking/add', json={'tracking_id': tracking_id, 'name': tracking_id})
+        seeded = client.get('/health').get_json()['tracking_ids_count']
+
+        start = ctx.Event()
+        processes = [ctx.Process(target=worker, args=(i, args.updates, data_dir, args.backend, start))
+                     for i in range(args.processes)]
+        for p in processes:
+            p.start()
+        time.sleep(1)  # let every worker finish importing the app
+        began = time.time()
+        start.set()
+        for p in processes:
+            p.join()
+        elapsed = time.time() - began
+
+        if any(p.exitcode != 0 for p in processes):
+            print("❌ A worker process failed")
+            return 1
+
+        # Read back through a fresh store so nothing is served from this process's cache
+        import server
+        from store import ShipmentStore
+        from storage import create_backend
+        store = ShipmentStore(create_backend(args.backend, server.DATA_FILE, server.DB_FILE), None)
+
+        lost = []
+        expected_last = str(args.updates - 1)
+        for i in range(args.processes):
+            record = store.get(own_id(i))
+            if record is None or record.get('zip') != expected_last:
+                lost.append(f"{own_id(i)}.zip = {record and record.get('zip')!r}")
+        shared = store.get(SHARED_ID)
+        for i, field in enumerate(SHARED_FIELDS[:args.processes]):
+            if shared.get(field) != f"p{i}-{expected_last}":
+                lost.append(f"{SHARED_ID}.{field} = {shared.get(field)!r}")
+        if store.count() != seeded:
+            lost.append(f"expected {seeded} tracking IDs, found {store.count()}")
+
+        total = args.processes * args.updates + min(args.processes, len(SHARED_FIELDS)) * args.updates
+        print(f"\n📊 {total} updates from {args.processes} processes in {elapsed:.2f}s "
+              f"({total / elapsed:.0f}/s, {args.backend} backend)")
+        if lost:
+            print(f"❌ {len(lost)} lost updates:")
+            for item in lost:
+                print(f"   • {item}")
+            return 1
+        print("✅ No updates lost")
+        return 0
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())